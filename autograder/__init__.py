@@ -5,8 +5,22 @@ import collections as _collections
 import argparse as _argparse
 import multiprocessing as _multiprocessing
 import json as _json
+import asyncio as _asyncio
+import pickle as _pickle
 import sys as _sys
 import traceback as _traceback
+import time as _time
+import threading as _threading
+import contextlib as _contextlib
+import contextvars as _contextvars
+import hashlib as _hashlib
+import os as _os
+import warnings as _warnings
+
+from . import cache as _cache
+from . import results as _results
+from . import scheduler as _scheduler
+from . import batch as _batch
 
 
 class Backend(metaclass=_abc.ABCMeta):
@@ -18,15 +32,37 @@ class Backend(metaclass=_abc.ABCMeta):
         pass
     def setup(self, **data):
         pass
+    def fingerprint(self, id, hasher):
+        pass
 
 class Action(metaclass=_abc.ABCMeta):
+    # what performing this holds from the session's ResourcePool, e.g.
+    # {'cpu': 1, 'memory': 256*2**20}; nothing by default
+    cost = {}
     @_abc.abstractmethod
     def perform(self, data, work_dir):
         pass
+    def fingerprint(self, hasher):
+        # for the result cache: whatever the outcome depends on besides the
+        # submission and the gradefile, like files copied in from elsewhere
+        pass
+    async def perform_async(self, data, work_dir):
+        # actions with nothing better to do block a worker thread instead
+        return await _scheduler.offload(self.perform, data, work_dir)
 
 class Reporter(metaclass=_abc.ABCMeta):
     def setup(self, **data):
         pass
+    def on_start(self, ids):
+        pass
+    def on_individual_start(self, id):
+        pass
+    def on_action_start(self, id, name):
+        pass
+    def on_individual_end(self, id, success):
+        # done grading, though with batch grades its results (and so
+        # on_individual_completion) come later
+        pass
     def on_part_completion(self, name, data):
         pass
     def on_individual_completion(self, id, success, data, global_data):
@@ -50,43 +86,134 @@ except ImportError:
                 return s
 import sys as _sys
 
+def _format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02}m'.format(seconds//3600, seconds%3600//60)
+    return '{}m{:02}s'.format(seconds//60, seconds%60)
+
 class _TerminalReporter(Reporter):
     requirements = {}
 
-    def __init__(self):
+    def __init__(self, live=None, log=None, refresh=0.5, slowest=5):
         if _blessings is None:
             self.terminal
         self.terminal = _blessings.Terminal()
         self.failed_ids = []
         self.ids = []
+        # a redrawn summary instead of every part of every submission, which
+        # goes to the log instead
+        self.live = _sys.stdout.isatty() if live is None else live
+        self.log = log if log is not None or not self.live else 'autograder.log'
+        self.refresh = refresh
+        self.slowest = slowest
+        self.lock = _threading.Lock()
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self.in_flight = {}
+        self.drawn = 0
+        self.started = _time.monotonic()
+        self._out = None
+        self._stop = _threading.Event()
+        self._drawer = None
+    def _output(self):
+        if self._out is None:
+            self._out = open(self.log, 'w') if self.log is not None else _sys.stdout
+        return self._out
+    def _write(self, *parts):
+        with self.lock:
+            out = self._output()
+            for part in parts:
+                out.write(part)
+            if out is not _sys.stdout:
+                out.flush()
+    def on_start(self, ids):
+        self.total = len(ids)
+        self.started = _time.monotonic()
+        if self.live and self._drawer is None:
+            self._drawer = _threading.Thread(target=self._draw_loop, daemon=True)
+            self._drawer.start()
+    def on_individual_start(self, id):
+        with self.lock:
+            self.in_flight[id] = [_time.monotonic(), '']
+    def on_action_start(self, id, name):
+        with self.lock:
+            if id in self.in_flight:
+                self.in_flight[id][1] = name
+    def on_individual_end(self, id, success):
+        # counted here rather than on completion, which batch grades hold
+        # back until every submission is done
+        with self.lock:
+            self.in_flight.pop(id, None)
+            self.done += 1
+            if not success:
+                self.failed += 1
     def on_part_completion(self, name, data):
         t = self.terminal
         if data['success']:
-            _sys.stdout.write(t.green('[SUCCESS] '))
+            status = t.green('[SUCCESS] ')
         else:
-            _sys.stdout.write(t.red('[FAILURE] '))
-        _sys.stdout.write(name+': ')
-        _sys.stdout.write(t.italic(data['operation']))
-        _sys.stdout.write('\n')
-        _sys.stdout.write(data.get('output', ''))
-        _sys.stdout.write('\n')
+            status = t.red('[FAILURE] ')
+        self._write(status, name+': ', t.italic(data['operation']), '\n', data.get('output', ''), '\n')
     def on_individual_completion(self, id, success, data, global_data):
         t = self.terminal
         traceback = data.get(
             'traceback',
             '\n'.join('    {operation} failed. {output}'.format(**d) for d in data.values() if isinstance(d, dict) and 'success' in d and not d['success']))
-        self.ids.append(id)
+        with self.lock:
+            self.ids.append(id)
+            if not success:
+                self.failed_ids.append((id, traceback))
         if success:
             c = lambda s: t.green(t.underline(s))
         else:
-            self.failed_ids.append((id, traceback))
             c = lambda s: t.red(t.underline(s))
-        _sys.stdout.write(c('Finished {}: {}\n'.format(
-            id,
-            'success' if success else 'failure')))
-        if not success:
-            _sys.stdout.write(traceback+'\n')
+        self._write(
+            c('Finished {}: {}\n'.format(
+                id,
+                'success' if success else 'failure')),
+            '' if success else traceback+'\n')
+    def status_lines(self):
+        with self.lock:
+            now = _time.monotonic()
+            done = self.done
+            failed = self.failed
+            in_flight = sorted(self.in_flight.items(), key=lambda i: i[1][0])
+        elapsed = now - self.started
+        rate = done/(elapsed/60) if elapsed > 0 else 0
+        queued = None if self.total is None else max(self.total - done - len(in_flight), 0)
+        if self.total is not None and rate > 0:
+            eta = _format_duration((self.total - done)/rate*60)
+        else:
+            eta = '?'
+        lines = ['done {}{}  in flight {}  queued {}  failed {}'.format(
+            done,
+            '' if self.total is None else '/{}'.format(self.total),
+            len(in_flight),
+            '?' if queued is None else queued,
+            failed)]
+        lines.append('{:.1f}/min  elapsed {}  eta {}'.format(rate, _format_duration(elapsed), eta))
+        for id, (started, action) in in_flight[:self.slowest]:
+            lines.append('  {}  {}  {}'.format(_format_duration(now - started), id, action))
+        return lines
+    def _draw(self):
+        lines = self.status_lines()
+        # back over what we drew last time, and clear it
+        prefix = '\x1b[{}F\x1b[J'.format(self.drawn) if self.drawn else ''
+        _sys.stdout.write(prefix + '\n'.join(lines) + '\n')
+        _sys.stdout.flush()
+        self.drawn = len(lines)
+    def _draw_loop(self):
+        while not self._stop.wait(self.refresh):
+            self._draw()
     def on_completion(self, data):
+        if self._drawer is not None:
+            self._stop.set()
+            self._drawer.join()
+            self._draw()
+        if self._out is not None and self._out is not _sys.stdout:
+            self._out.close()
         if len(self.failed_ids) > 0:
             _sys.stdout.write(self.terminal.red('Failed IDs:\n'))
             for id, trace in self.failed_ids:
@@ -98,27 +225,217 @@ class _TerminalReporter(Reporter):
             for id, trace in self.failed_ids:
                 _sys.stdout.write(id+'\n')
 
+def _describe_action(action):
+    for a in (action, getattr(action, '_proc', None)):
+        name = getattr(a, 'name', None)
+        if isinstance(name, str):
+            return name
+    return type(action).__name__
 
 class ActionSequence(Action):
-    def __init__(self, actions, reporters=[]):
+    def __init__(self, actions, reporters=[], id=None, progress=None):
         self.actions = actions
         self.reporters = reporters
+        self.id = id
+        # told what is running even when part results are held back
+        self.progress = reporters if progress is None else progress
+    def _starting(self, action, name=None):
+        for reporter in self.progress:
+            reporter.on_action_start(self.id, name if name is not None else _describe_action(action))
+    def _finished(self, data):
+        for reporter in self.reporters:
+            reporter.on_part_completion(*list(data.items())[-1])
     def perform(self, data, workdir):
         for action in self.actions:
-            success = action.perform(data, workdir)
-            for reporter in self.reporters:
-                reporter.on_part_completion(*list(data.items())[-1])
+            if isinstance(action, ActionGraph):
+                success = action.perform(data, workdir, sequence=self)
+            else:
+                self._starting(action)
+                success = _scheduler.perform(action, data, workdir)
+                self._finished(data)
+            if not success:
+                return False
+        return True
+    async def perform_async(self, data, workdir):
+        for action in self.actions:
+            if isinstance(action, ActionGraph):
+                success = await action.perform_async(data, workdir, sequence=self)
+            else:
+                self._starting(action)
+                success = await _scheduler.perform_async(action, data, workdir)
+                self._finished(data)
             if not success:
                 return False
         return True
 
+class _GraphRun:
+    # bookkeeping for one ActionGraph.perform. Only the thread or task
+    # driving the graph touches this or the submission's data; each step
+    # works on its own copy and what it adds is merged back when it is done.
+    def __init__(self, graph, data, sequence):
+        self.graph = graph
+        self.data = data
+        self.sequence = sequence
+        self.waiting = list(graph.steps)
+        self.succeeded = set()
+        self.failed = set()
+        self.error = None
+
+    def ready(self):
+        if self.error is not None:
+            return []
+        skipped = True
+        while skipped:
+            # never run, and neither does anything after them
+            skipped = [name for name in self.waiting if any(dep in self.failed for dep in self.graph.after[name])]
+            for name in skipped:
+                self.waiting.remove(name)
+                self.failed.add(name)
+        ready = [name for name in self.waiting if all(dep in self.succeeded for dep in self.graph.after[name])]
+        for name in ready:
+            self.waiting.remove(name)
+        return ready
+
+    def start(self, name):
+        action = self.graph.steps[name]
+        if self.sequence is not None:
+            self.sequence._starting(action, name)
+        local = _collections.OrderedDict(self.data)
+        return action, local, dict(local)
+
+    def finish(self, name, local, before, success, error=None):
+        added = [(k, v) for k, v in local.items() if k not in before or before[k] is not v]
+        for k, v in added:
+            if k not in before and isinstance(v, dict) and isinstance(self.data.get(k), dict) and 'success' not in v:
+                # e.g. 'grades', started separately by steps running side by side
+                self.data[k].update(v)
+            else:
+                self.data[k] = v
+        if error is not None and self.error is None:
+            self.error = error
+        (self.succeeded if success and error is None else self.failed).add(name)
+        if self.sequence is not None and added:
+            for reporter in self.sequence.reporters:
+                reporter.on_part_completion(*added[-1])
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return len(self.succeeded) == len(self.graph.steps)
+
+class ActionGraph(Action):
+    # steps are (name, action, names of the steps it needs) tuples. Steps
+    # whose dependencies have all succeeded run side by side; when one
+    # fails, only what depends on it is skipped.
+    def __init__(self, steps):
+        self.steps = _collections.OrderedDict()
+        self.after = {}
+        for name, action, after in steps:
+            if name in self.steps:
+                raise ValueError('duplicate step: {}'.format(name))
+            self.steps[name] = action
+            self.after[name] = list(after)
+        for name, after in self.after.items():
+            for dep in after:
+                if dep not in self.steps:
+                    raise ValueError('{} depends on unknown step {}'.format(name, dep))
+        self._check_acyclic()
+
+    def fingerprint(self, hasher):
+        for action in self.steps.values():
+            action.fingerprint(hasher)
+
+    def _check_acyclic(self):
+        remaining = {name: set(after) for name, after in self.after.items()}
+        while remaining:
+            free = [name for name, after in remaining.items() if not after]
+            if not free:
+                raise ValueError('dependency cycle among steps: {}'.format(', '.join(sorted(remaining))))
+            for name in free:
+                del remaining[name]
+            for after in remaining.values():
+                after.difference_update(free)
+
+    def perform(self, data, work_dir, sequence=None):
+        run = _GraphRun(self, data, sequence)
+        with _futures.ThreadPoolExecutor(max_workers=max(len(self.steps), 1)) as executor:
+            running = {}
+            def launch():
+                for name in run.ready():
+                    action, local, before = run.start(name)
+                    # each thread needs its own copy of the context, so steps
+                    # still see the session's pool and global directory
+                    context = _contextvars.copy_context()
+                    future = executor.submit(context.run, _scheduler.perform, action, local, work_dir)
+                    running[future] = (name, local, before)
+            launch()
+            while running:
+                done, _ = _futures.wait(running, return_when=_futures.FIRST_COMPLETED)
+                for future in done:
+                    name, local, before = running.pop(future)
+                    error = future.exception()
+                    run.finish(name, local, before, error is None and future.result(), error)
+                launch()
+        return run.result()
+
+    async def perform_async(self, data, work_dir, sequence=None):
+        run = _GraphRun(self, data, sequence)
+        running = {}
+        def launch():
+            for name in run.ready():
+                action, local, before = run.start(name)
+                task = _asyncio.ensure_future(_scheduler.perform_async(action, local, work_dir))
+                running[task] = (name, local, before)
+        launch()
+        while running:
+            done, _ = await _asyncio.wait(running, return_when=_asyncio.FIRST_COMPLETED)
+            for task in done:
+                name, local, before = running.pop(task)
+                error = task.exception()
+                run.finish(name, local, before, error is None and task.result(), error)
+            launch()
+        return run.result()
+
+_global_dir = _contextvars.ContextVar('global_dir', default=None)
+
+def global_dir():
+    # where the session's global actions ran, for actions that reuse what
+    # they built; None outside a run
+    return _global_dir.get()
+
+@_contextlib.contextmanager
+def _in_global_dir(path):
+    token = _global_dir.set(path)
+    try:
+        yield
+    finally:
+        _global_dir.reset(token)
+
 class Session:
-    def __init__(self, backends, reporters, actions, backend_setup={}):
+    def __init__(self, backends, reporters, actions, backend_setup={}, cache=None, executor='thread', resources=None, max_workers=None, batch=[], global_actions=[]):
+        if executor not in ('thread', 'process'):
+            raise ValueError('unknown executor: {}'.format(executor))
         self.backends = backends
         self.actions = actions
         self.reporters = reporters
+        self.cache = cache
+        self.executor = executor
+        self.resources = resources if resources is not None else _scheduler.ResourcePool()
+        self.max_workers = max_workers
+        self.batch = batch
+        self.global_actions = global_actions
+        self.global_dir = None
+        self._actions_fingerprint = None
+        if cache is not None:
+            for backend in self.backends:
+                if getattr(type(backend), 'fingerprint', None) is Backend.fingerprint:
+                    _warnings.warn('{} does not override fingerprint, so cached results will not notice its submissions changing'.format(type(backend).__name__), stacklevel=2)
         for backend in self.backends:
             backend.setup(**backend_setup)
+        # forked now, while this is the only thread: reporters start their
+        # own in setup, and a child forked with those running can inherit a
+        # lock (stdout's, say) that nothing will ever release
+        self._workers = self._fork_workers() if executor == 'process' else None
         for reporter in self.reporters:
             reporter.setup(**backend_setup)
         self.reporting_failed = set()
@@ -136,21 +453,175 @@ class Session:
         except Exception as ex:
             self.reporting_failed.add((id, _traceback.format_exc()))
 
-    def run_individual(self, id, global_data):
+    def run_individual(self, id, global_data, report=True):
         data = _collections.OrderedDict()
+        for reporter in self.reporters:
+            reporter.on_individual_start(id)
         with _tempfile.TemporaryDirectory() as work_dir:
+            start = _time.monotonic()
             try:
                 for backend in self.backends:
                     backend.prepare(id, data, work_dir)
-                seq = ActionSequence(self.actions, self.reporters)
-                success = seq.perform(data, work_dir)
+                data['timing'] = {'prepare': _time.monotonic() - start}
+                seq = ActionSequence(self.actions, self.reporters if report else [], id=id, progress=self.reporters)
+                with _scheduler.using(self.resources), _in_global_dir(self.global_dir):
+                    success = seq.perform(data, work_dir)
+                data['success'] = success
+            except Exception as ex:
+                data['success'] = False
+                data['traceback'] = _traceback.format_exc()
+            data.setdefault('timing', {})['total'] = _time.monotonic() - start
+            self._report_end(id, data)
+            if report:
+                self._run_reporters_individual_completion(id, data['success'], data, global_data)
+        return data
+
+    async def run_individual_async(self, id, global_data, report=True):
+        data = _collections.OrderedDict()
+        for reporter in self.reporters:
+            reporter.on_individual_start(id)
+        with _tempfile.TemporaryDirectory() as work_dir:
+            start = _time.monotonic()
+            try:
+                for backend in self.backends:
+                    await _scheduler.offload(backend.prepare, id, data, work_dir)
+                data['timing'] = {'prepare': _time.monotonic() - start}
+                seq = ActionSequence(self.actions, self.reporters if report else [], id=id, progress=self.reporters)
+                with _scheduler.using(self.resources), _in_global_dir(self.global_dir):
+                    success = await seq.perform_async(data, work_dir)
                 data['success'] = success
             except Exception as ex:
                 data['success'] = False
                 data['traceback'] = _traceback.format_exc()
-            self._run_reporters_individual_completion(id, data['success'], data, global_data)
+            data.setdefault('timing', {})['total'] = _time.monotonic() - start
+            self._report_end(id, data)
+            if report:
+                await _scheduler.offload(self._run_reporters_individual_completion, id, data['success'], data, global_data)
         return data
 
+    def _report_end(self, id, data):
+        for reporter in self.reporters:
+            reporter.on_individual_end(id, data['success'])
+
+    def _replay_individual(self, id, data, global_data):
+        for name, d in data.items():
+            if isinstance(d, dict) and 'success' in d:
+                for reporter in self.reporters:
+                    reporter.on_part_completion(name, d)
+        self._run_reporters_individual_completion(id, data['success'], data, global_data)
+
+    def _cache_key(self, id):
+        if self._actions_fingerprint is None:
+            # once per run, after the global actions, which CopyGlobal hashes
+            h = _hashlib.sha256()
+            with _in_global_dir(self.global_dir):
+                for action in self.actions:
+                    action.fingerprint(h)
+            self._actions_fingerprint = h.hexdigest()
+        return self.cache.key(id, self.backends, extra=self._actions_fingerprint)
+
+    def run_cached(self, id, global_data, report=True):
+        if self.cache is None:
+            return self.run_individual(id, global_data, report=report)
+        key = self._cache_key(id)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.run_individual(id, global_data, report=report)
+            self.cache.put(key, data)
+        else:
+            self._report_end(id, data)
+            if report:
+                self._replay_individual(id, data, global_data)
+        return data
+
+    async def run_cached_async(self, id, global_data, report=True):
+        if self.cache is None:
+            return await self.run_individual_async(id, global_data, report=report)
+        key = await _scheduler.offload(self._cache_key, id)
+        data = await _scheduler.offload(self.cache.get, key)
+        if data is None:
+            data = await self.run_individual_async(id, global_data, report=report)
+            await _scheduler.offload(self.cache.put, key, data)
+        else:
+            self._report_end(id, data)
+            if report:
+                await _scheduler.offload(self._replay_individual, id, data, global_data)
+        return data
+
+    def _global_results(self, data, results, success):
+        data['global_actions'] = results
+        if not success:
+            # every submission would fail the same way; better to stop here
+            name, result = list(results.items())[-1] if len(results) else ('global actions', {})
+            raise RuntimeError('{} failed:\n{}'.format(name, result.get('output', '')))
+
+    def run_global(self, data, global_dir):
+        # once per run, before any submission, in global_dir
+        self.global_dir = global_dir
+        self._actions_fingerprint = None
+        if not self.global_actions:
+            return
+        results = _collections.OrderedDict()
+        with _scheduler.using(self.resources), _in_global_dir(global_dir):
+            success = ActionSequence(self.global_actions).perform(results, global_dir)
+        self._global_results(data, results, success)
+
+    async def run_global_async(self, data, global_dir):
+        self.global_dir = global_dir
+        self._actions_fingerprint = None
+        if not self.global_actions:
+            return
+        results = _collections.OrderedDict()
+        with _scheduler.using(self.resources), _in_global_dir(global_dir):
+            success = await ActionSequence(self.global_actions).perform_async(results, global_dir)
+        self._global_results(data, results, success)
+
+    def _fork_workers(self):
+        # fork, so the session reaches the workers without having to pickle
+        # gradefile-defined actions; each run's global data follows later
+        self.resources.share()
+        progress = _multiprocessing.get_context('fork').SimpleQueue()
+        executor = _futures.ProcessPoolExecutor(
+            max_workers=self.max_workers or _multiprocessing.cpu_count(),
+            mp_context=_multiprocessing.get_context('fork'),
+            initializer=_init_process_worker,
+            initargs=(self, progress))
+        # with fork, the first task starts every worker at once
+        executor.submit(int).result()
+        return executor, progress
+
+    def _make_executor(self):
+        if self.executor == 'process':
+            # a pool lasts one run; any later run has to fork its own
+            workers, self._workers = self._workers, None
+            return workers if workers is not None else self._fork_workers()
+        # heavy steps are throttled by self.resources, so the pool itself
+        # can be wide enough to keep cheap ones moving
+        return _futures.ThreadPoolExecutor(max_workers=self.max_workers or _multiprocessing.cpu_count()*4), None
+
+    def _submit(self, executor, id, global_data):
+        if self.executor == 'process':
+            # workers only need what run_global left them; global data is
+            # for reporters, which are all in this process
+            return executor.submit(_process_run_individual, id, self.global_dir)
+        # batch grades have to be in before reporters see anything
+        return executor.submit(self.run_cached, id, global_data, report=not self.batch)
+
+    def _run_batch(self, submissions, global_data, writer, ids):
+        # grades are worked out over every submission, but reporters only
+        # hear about those graded this run, so a resumed run doesn't report
+        # (or e-mail) the earlier ids over again
+        ids = set(ids)
+        results = _batch.run_batch(self.batch, submissions)
+        for id, res in submissions.items():
+            if _batch.apply_batch(results, id, res):
+                if writer is None:
+                    submissions[id] = res
+                else:
+                    writer.write(id, res)
+            if id in ids:
+                self._replay_individual(id, res, global_data)
+
     def _make_ids_predicate(self, only_ids, except_ids):
         c = lambda id: True
         if only_ids is not None:
@@ -161,23 +632,77 @@ class Session:
             c = lambda id: c2(id) and id not in except_ids
         return c
 
-    def run(self, only_ids=None, except_ids=None):
+    def run(self, only_ids=None, except_ids=None, writer=None):
+        with _tempfile.TemporaryDirectory() as global_dir:
+            data = {}
+            for backend in self.backends:
+                backend.prepare_global(data, global_dir)
+            self.run_global(data, global_dir)
+            executor, progress = self._make_executor()
+            relay = _ProgressRelay(self, progress) if progress is not None else None
+            try:
+                with executor:
+                    submissions = {} if writer is None else writer.submissions()
+                    c = self._make_ids_predicate(only_ids, except_ids)
+                    ids = [id for id in self.get_ids() if c(id) and id not in submissions]
+                    for reporter in self.reporters:
+                        reporter.on_start(ids)
+                    procs = {self._submit(executor, id, data): id for id in ids}
+                    for proc in _futures.as_completed(procs):
+                        id = procs[proc]
+                        try:
+                            res = proc.result()
+                        except Exception as exc:
+                            raise exc
+                        else:
+                            if relay is not None:
+                                relay.finish(id, res)
+                            if self.executor == 'process' and not self.batch:
+                                # reporters live in this process, so they hear about
+                                # the submission only once its data has come back
+                                self._replay_individual(id, res, data)
+                            if writer is None:
+                                submissions[id] = res
+                            else:
+                                writer.write(id, res)
+                    if self.batch:
+                        self._run_batch(submissions, data, writer, ids)
+                    data['submissions'] = submissions
+            finally:
+                if relay is not None:
+                    relay.close()
+            for reporter in self.reporters:
+                reporter.on_completion(data)
+        return data
+
+    async def run_async(self, only_ids=None, except_ids=None, writer=None):
         with _tempfile.TemporaryDirectory() as global_dir:
             data = {}
             for backend in self.backends:
                 backend.prepare_global(data, global_dir)
-            with _futures.ThreadPoolExecutor(max_workers=_multiprocessing.cpu_count()*4) as executor:
-                submissions = {}
+            # only blocking python code runs on threads; subprocesses are
+            # waited on by the event loop, so far more can be in flight
+            in_flight = _asyncio.Semaphore(self.max_workers or _multiprocessing.cpu_count()*32)
+            async def run_one(id):
+                async with in_flight:
+                    return id, await self.run_cached_async(id, data, report=not self.batch)
+            with _futures.ThreadPoolExecutor(max_workers=_multiprocessing.cpu_count()) as executor, \
+                    _scheduler.offloading_to(executor):
+                await self.run_global_async(data, global_dir)
+                submissions = {} if writer is None else writer.submissions()
                 c = self._make_ids_predicate(only_ids, except_ids)
-                procs = {executor.submit(self.run_individual, id, data): id for id in self.get_ids() if c(id)}
-                for proc in _futures.as_completed(procs):
-                    id = procs[proc]
-                    try:
-                        res = proc.result()
-                    except Exception as exc:
-                        raise exc
-                    else:
+                ids = [id for id in self.get_ids() if c(id) and id not in submissions]
+                for reporter in self.reporters:
+                    reporter.on_start(ids)
+                tasks = [run_one(id) for id in ids]
+                for task in _asyncio.as_completed(tasks):
+                    id, res = await task
+                    if writer is None:
                         submissions[id] = res
+                    else:
+                        writer.write(id, res)
+                if self.batch:
+                    await _scheduler.offload(self._run_batch, submissions, data, writer, ids)
                 data['submissions'] = submissions
             for reporter in self.reporters:
                 reporter.on_completion(data)
@@ -185,16 +710,91 @@ class Session:
 
     def run_from_results(self, results, except_ids=None, only_ids=None):
         c = self._make_ids_predicate(only_ids, except_ids)
-        for id, data in results['submissions'].items():
-            if not c(id): continue
-            for name, d in data.items():
-                if isinstance(d, dict) and 'success' in d:
-                    for reporter in self.reporters:
-                        reporter.on_part_completion(name, d)
-            self._run_reporters_individual_completion(id, data['success'], data, results)
+        ids = [id for id in results['submissions'] if c(id)]
+        for reporter in self.reporters:
+            reporter.on_start(ids)
+        submissions = results['submissions']
+        if len(ids) == len(submissions):
+            pairs = submissions.items()
+        else:
+            # with a streamed results file, only the wanted ids get parsed
+            pairs = ((id, submissions[id]) for id in ids)
+        for id, data in pairs:
+            self._report_end(id, data)
+            self._replay_individual(id, data, results)
         for reporter in self.reporters:
             reporter.on_completion(results)
 
+_process_session = None
+
+class _ProgressForwarder(Reporter):
+    # stands in for the reporters in a process worker, whose copies would
+    # otherwise hear about progress nobody can see
+    def __init__(self, queue):
+        self.queue = queue
+    def on_individual_start(self, id):
+        self.queue.put(('on_individual_start', id, ()))
+    def on_action_start(self, id, name):
+        self.queue.put(('on_action_start', id, (name,)))
+
+class _ProgressRelay:
+    # hands what process workers forward on to the session's reporters.
+    # Workers put events before their result comes back, but they are read
+    # on another thread, so any still on their way once the result is in
+    # are dropped rather than arriving after on_individual_completion.
+    def __init__(self, session, queue):
+        self.session = session
+        self.queue = queue
+        self.lock = _threading.Lock()
+        self.finished = set()
+        self.thread = _threading.Thread(target=self._relay, daemon=True)
+        self.thread.start()
+    def _relay(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            name, id, args = event
+            with self.lock:
+                if id in self.finished:
+                    continue
+                try:
+                    for reporter in self.session.reporters:
+                        getattr(reporter, name)(id, *args)
+                except Exception:
+                    # keep reading, or workers block on a full pipe
+                    self.session.reporting_failed.add((id, _traceback.format_exc()))
+    def finish(self, id, data):
+        with self.lock:
+            self.finished.add(id)
+            self.session._report_end(id, data)
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.queue.close()
+
+def _init_process_worker(session, progress):
+    global _process_session
+    session.reporters = [_ProgressForwarder(progress)]
+    _process_session = session
+
+def _picklable(data):
+    try:
+        _pickle.dumps(data)
+        return data
+    except Exception:
+        # same lossy conversion the results file gets
+        return _json.loads(
+            _json.dumps(data, default=_results.default),
+            object_pairs_hook=_collections.OrderedDict)
+
+def _process_run_individual(id, global_dir):
+    if _process_session.global_dir != global_dir:
+        # set up by run_global in the parent after this worker was forked
+        _process_session.global_dir = global_dir
+        _process_session._actions_fingerprint = None
+    return _picklable(_process_session.run_cached(id, None, report=False))
+
 def setup_args(parser, backends):
     reqs = {}
     for backend in backends:
@@ -204,23 +804,66 @@ def setup_args(parser, backends):
         h['required'] = required
         parser.add_argument('--'+name, **h)
 
+def _cache_salt(gradefile_source, definitions, imported, roots):
+    # the gradefile, the modules of its own it imports, and anything else
+    # it says its results depend on (cache_salt)
+    h = _hashlib.sha256(gradefile_source.encode('utf-8'))
+    roots = [_os.path.join(_os.path.abspath(root), '') for root in roots]
+    for name in sorted(imported):
+        filename = getattr(_sys.modules.get(name), '__file__', None)
+        if filename is None or not any(_os.path.abspath(filename).startswith(root) for root in roots):
+            continue
+        h.update(name.encode('utf-8') + b'\0')
+        try:
+            with open(filename, 'rb') as f:
+                h.update(f.read())
+        except OSError:
+            pass
+        h.update(b'\0')
+    h.update(str(definitions.get('cache_salt', '')).encode('utf-8'))
+    return h.hexdigest()
+
 def main():
     first_parser = _argparse.ArgumentParser()
     first_parser.add_argument('gradefile', type=_argparse.FileType('r'), help='python file defining backends, reporters and actions to take')
     first_parser.add_argument('--run-from', nargs='?', type=_argparse.FileType('r'), default=None, help='report the contents of this result file')
     first_parser.add_argument('--output', nargs='?', type=_argparse.FileType('w'), help='filename to output json', default=_sys.stdout)
+    first_parser.add_argument('--format', choices=['json', 'compact'], default='json', help='write --output as indented JSON, or as a compressed file with an index by id (read back with --run-from, or turn into JSON with python -m autograder.convert)')
     first_parser.add_argument('--only-terminal', action='store_true', help='disables all reporters, displaying output on the terminal only')
+    first_parser.add_argument('--live', action=_argparse.BooleanOptionalAction, default=None, help='with --only-terminal, show a live progress summary instead of every result (default: when stdout is a terminal)')
+    first_parser.add_argument('--log', default=None, help='with --live, where the full output goes (default: autograder.log)')
     first_parser.add_argument('--except-ids', nargs='+', default=None)
     first_parser.add_argument('--only-ids', nargs='+', default=None)
+    first_parser.add_argument('--engine', choices=['pool', 'asyncio'], default='pool', help='run submissions on the --executor pool, or drive their subprocesses from an asyncio event loop')
+    first_parser.add_argument('--executor', choices=['thread', 'process'], default='thread', help='run submissions on a pool of threads or of processes')
+    first_parser.add_argument('--checkpoint', default=None, help='append each result to this JSON lines file as soon as it is ready')
+    first_parser.add_argument('--resume', default=None, help='carry on from this --checkpoint file, grading only the ids it does not have yet')
+    first_parser.add_argument('--max-workers', type=int, default=None, help='number of submissions in flight at once')
+    first_parser.add_argument('--cpus', type=int, default=None, help='CPU slots shared by heavy steps like compiles and valgrind, and handed to make as a jobserver (default: all cores)')
+    first_parser.add_argument('--cache', default=None, help='directory in which to keep results of unchanged submissions between runs')
     args, rest = first_parser.parse_known_args()
-    compiled_definitions = compile(args.gradefile.read(), 'input', 'exec')
+    gradefile_source = args.gradefile.read()
+    gradefile_dir = _os.path.dirname(args.gradefile.name)
+    compiled_definitions = compile(gradefile_source, 'input', 'exec')
     definitions = {}
+    already_imported = set(_sys.modules)
     exec(compiled_definitions, definitions)
+    imported = set(_sys.modules) - already_imported
     output_file = args.output
     input_file = args.run_from
+    output_format = args.format
     only_terminal = args.only_terminal
     except_ids = args.except_ids
     only_ids = args.only_ids
+    cache = args.cache
+    executor = args.executor
+    engine = args.engine
+    checkpoint = args.checkpoint
+    resume = args.resume
+    max_workers = args.max_workers
+    cpus = args.cpus
+    live = args.live
+    log = args.log
     parser = _argparse.ArgumentParser()
     if input_file is None:
         setup_args(parser, definitions['backends'])
@@ -230,16 +873,42 @@ def main():
 
     session = Session(
         definitions['backends'] if input_file is None else [],
-        definitions['reporters'] if not only_terminal else [_TerminalReporter()],
+        definitions['reporters'] if not only_terminal else [_TerminalReporter(live=live, log=log)],
         definitions['actions'],
-        backend_setup=args.__dict__)
+        backend_setup=args.__dict__,
+        cache=_cache.ResultCache(cache, salt=_cache_salt(gradefile_source, definitions, imported, [gradefile_dir, _os.getcwd()])) if cache is not None and input_file is None else None,
+        executor=executor,
+        resources=_scheduler.ResourcePool(cpus=cpus, jobserver=True),
+        max_workers=max_workers,
+        batch=definitions.get('batch', []),
+        global_actions=definitions.get('global_actions', []) if input_file is None else [])
 
     if input_file is not None:
-        results = _json.load(input_file)
+        results = _results.load(input_file)
         session.run_from_results(results, except_ids=except_ids, only_ids=only_ids)
     else:
-        results = session.run(except_ids=except_ids, only_ids=only_ids)
-        _json.dump(results, output_file, indent=2, default=repr)
+        if resume is not None:
+            writer = _results.JSONLWriter(resume, resume=True)
+        elif checkpoint is not None:
+            writer = _results.JSONLWriter(checkpoint)
+        else:
+            writer = None
+        if engine == 'asyncio':
+            results = _asyncio.run(session.run_async(except_ids=except_ids, only_ids=only_ids, writer=writer))
+        else:
+            results = session.run(except_ids=except_ids, only_ids=only_ids, writer=writer)
+        if output_format == 'compact':
+            output_file.flush()
+            _results.dump_compact(results, output_file.buffer)
+            index = None
+        else:
+            index = _results.dump(results, output_file)
+        if writer is not None:
+            writer.close()
+        if output_file is not _sys.stdout and index is not None:
+            # lets a later --run-from skip straight to each submission
+            output_file.close()
+            _results.save_index(output_file.name, index)
 
     # if reporting failed, note the swallowed exception:
     if len(session.reporting_failed) != 0:
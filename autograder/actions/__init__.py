@@ -1,13 +1,31 @@
 import autograder as _autograder
+import abc as _abc
 import shutil as _shutil
 import os as _os
 import os.path as _path
 import json as _json
 import traceback as _traceback
 import subprocess as _subprocess
+import hashlib as _hashlib
+import selectors as _selectors
+import time as _time
+import asyncio as _asyncio
+import contextlib as _contextlib
+import autograder.cache as _cache
+import autograder.staging as _staging
+import autograder.scheduler as _scheduler
+import signal as _signal
+import sys as _sys
+import threading as _threading
+
+try:
+    import resource as _resource
+except ImportError:
+    _resource = None
 
 from .meta import CopyToSourceDir
 from .template import WriteTemplate
+from .buildcache import BuildCache
 
 def find_command(*args, path=None):
     for arg in args:
@@ -16,12 +34,248 @@ def find_command(*args, path=None):
             return result
     raise NameError(args)
 
+_MiB = 2**20
+
+class _OutputCapture:
+    # keeps at most `limit` bytes: the first half of the output and a rolling
+    # window over the rest, counting whatever falls out of the middle
+    def __init__(self, limit=None, spill=None):
+        self.limit = limit
+        self.spill = spill
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+    def feed(self, chunk):
+        if self.spill is not None:
+            self.spill.write(chunk)
+        if self.limit is None:
+            self.head += chunk
+            return
+        room = self.limit//2 - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        self.tail += chunk
+        excess = len(self.tail) - (self.limit - len(self.head))
+        if excess > 0:
+            del self.tail[:excess]
+            self.dropped += excess
+    def text(self):
+        out = bytes(self.head)
+        if self.dropped:
+            out += '\n[... {} bytes dropped ...]\n'.format(self.dropped).encode()
+        out += bytes(self.tail)
+        # what universal_newlines=True used to give us
+        return out.decode('utf-8', 'replace').replace('\r\n', '\n').replace('\r', '\n')
+
+# what Subprocess(limits=...) can cap, and the rlimit behind each
+_RLIMITS = {
+    'cpu': 'RLIMIT_CPU',             # seconds of CPU time
+    'memory': 'RLIMIT_AS',           # bytes of address space
+    'processes': 'RLIMIT_NPROC',     # processes, counted over the whole user
+    'file_size': 'RLIMIT_FSIZE',     # bytes in any one file written
+    'open_files': 'RLIMIT_NOFILE',   # file descriptors
+}
+
+# how a child that ran into a limit tends to say so. Anything can print
+# these, so they are only ever reported as suspicions.
+_LIMIT_MESSAGES = {
+    'memory': ('Cannot allocate memory', 'std::bad_alloc', 'MemoryError', 'out of memory'),
+    'processes': ('Resource temporarily unavailable', 'fork: retry'),
+    'open_files': ('Too many open files',),
+    # for children that ignore SIGXFSZ, as python does, and what a shell
+    # says when a command it ran was killed by either signal
+    'file_size': ('File too large', 'File size limit exceeded'),
+    'cpu': ('CPU time limit exceeded',),
+}
+
+# run ahead of the command in place of a preexec_fn, which isn't safe to use
+# with threads about: a fresh interpreter sets the limits and execs the
+# command, so nothing runs between fork and exec in ours
+_LIMITER = """
+import json, os, resource, signal, sys
+for name, soft, hard in json.loads(sys.argv[1]):
+    resource.setrlimit(getattr(resource, name), (soft, hard))
+# python ignores these at startup, and exec would pass that on
+signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+try:
+    os.execv(sys.argv[2], sys.argv[2:])
+except OSError as e:
+    sys.stderr.write('{}: {}\\n'.format(sys.argv[2], e.strerror))
+    os._exit(127)
+"""
+
+def _rlimits(limits):
+    # worked out in the parent, so the child only has setrlimit calls to make
+    if _resource is None:
+        raise ValueError('resource limits are not supported here')
+    settings = []
+    for name, value in limits.items():
+        if name not in _RLIMITS:
+            raise ValueError('unknown resource limit: {}'.format(name))
+        which = getattr(_resource, _RLIMITS[name])
+        _, hard = _resource.getrlimit(which)
+        # one second's grace between SIGXCPU and SIGKILL
+        wanted_hard = value + 1 if name == 'cpu' else value
+        if hard != _resource.RLIM_INFINITY:
+            value, wanted_hard = min(value, hard), min(wanted_hard, hard)
+        settings.append((_RLIMITS[name], value, wanted_hard))
+    return _limiter(settings)
+
+def _limiter(settings):
+    return [_sys.executable, '-I', '-S', '-c', _LIMITER, _json.dumps(settings)]
+
+_limiter_cost = None
+_limiter_cost_lock = _threading.Lock()
+
+def _limiter_overhead():
+    # what _LIMITER adds to a step's timing, measured once ahead of a
+    # command that does nothing, so it can be taken back out
+    global _limiter_cost
+    with _limiter_cost_lock:
+        if _limiter_cost is None:
+            true = _shutil.which('true')
+            _limiter_cost = {'wall': 0, 'cpu_user': 0, 'cpu_system': 0, 'max_rss': 0}
+            if true is not None and hasattr(_os, 'wait4'):
+                start = _time.monotonic()
+                _, rusage = _run_captured(_limiter([]) + [true], None, None, _OutputCapture())
+                _limiter_cost.update(
+                    wall=_time.monotonic() - start,
+                    cpu_user=rusage.ru_utime,
+                    cpu_system=rusage.ru_stime,
+                    max_rss=rusage.ru_maxrss)
+        return _limiter_cost
+
+def _limit_exceeded(limits, return_code, rusage=None):
+    # only what the kernel tells us: the signal, or the CPU time used. A
+    # shell (sh -c, make) exits with 128+signal when a command it ran got
+    # one, which is as close as we get for those.
+    if return_code == 0:
+        return None
+    if 'cpu' in limits:
+        if return_code in (-_signal.SIGXCPU, 128 + _signal.SIGXCPU):
+            return 'cpu'
+        if return_code == -_signal.SIGKILL and rusage is not None and \
+                rusage.ru_utime + rusage.ru_stime >= limits['cpu']:
+            return 'cpu'
+    if 'file_size' in limits and return_code in (-_signal.SIGXFSZ, 128 + _signal.SIGXFSZ):
+        return 'file_size'
+    return None
+
+def _limit_suspected(limits, return_code, output):
+    if return_code == 0:
+        return None
+    for name, messages in _LIMIT_MESSAGES.items():
+        if name in limits and any(m in output for m in messages):
+            return name
+    return None
+
+def _own_max_rss():
+    # in the same units as a child's ru_maxrss
+    if _resource is None:
+        return 0
+    return _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+
+def _wait(proc, command, timeout, deadline):
+    if not hasattr(_os, 'wait4'):
+        remaining = None if deadline is None else max(deadline - _time.monotonic(), 0)
+        return proc.wait(timeout=remaining), None
+    # reap the child ourselves so we get its resource usage
+    while True:
+        pid, status, rusage = _os.wait4(proc.pid, 0 if deadline is None else _os.WNOHANG)
+        if pid != 0:
+            break
+        if _time.monotonic() >= deadline:
+            raise _subprocess.TimeoutExpired(command, timeout)
+        _time.sleep(0.01)
+    proc.returncode = _os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage
+
+def _kill(proc, group):
+    if not group:
+        proc.kill()
+        return
+    # make and every job it started, so none of them is left holding the
+    # jobserver pipe
+    try:
+        _os.killpg(proc.pid, _signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def _run_captured(command, cwd, timeout, capture, env=None, pass_fds=()):
+    deadline = None if timeout is None else _time.monotonic() + timeout
+    with _subprocess.Popen(
+            command,
+            stdout=_subprocess.PIPE,
+            stderr=_subprocess.STDOUT,
+            cwd=cwd,
+            env=env,
+            pass_fds=pass_fds,
+            start_new_session=bool(pass_fds)) as proc:
+        try:
+            with _selectors.DefaultSelector() as sel:
+                sel.register(proc.stdout, _selectors.EVENT_READ)
+                while True:
+                    remaining = None if deadline is None else deadline - _time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise _subprocess.TimeoutExpired(command, timeout)
+                    if not sel.select(remaining):
+                        continue
+                    chunk = _os.read(proc.stdout.fileno(), 1 << 16)
+                    if not chunk:
+                        break
+                    capture.feed(chunk)
+            return _wait(proc, command, timeout, deadline)
+        except:
+            _kill(proc, bool(pass_fds))
+            raise
+
+async def _run_captured_async(command, cwd, timeout, capture, env=None, pass_fds=()):
+    proc = await _asyncio.create_subprocess_exec(
+        *command,
+        stdout=_subprocess.PIPE,
+        stderr=_subprocess.STDOUT,
+        cwd=cwd,
+        env=env,
+        pass_fds=pass_fds,
+        start_new_session=bool(pass_fds))
+    async def communicate():
+        while True:
+            chunk = await proc.stdout.read(1 << 16)
+            if not chunk:
+                break
+            capture.feed(chunk)
+        return await proc.wait()
+    try:
+        return await _asyncio.wait_for(communicate(), timeout)
+    except _asyncio.TimeoutError:
+        raise _subprocess.TimeoutExpired(command, timeout)
+    finally:
+        if proc.returncode is None:
+            _kill(proc, bool(pass_fds))
+            await proc.wait()
+
 class Subprocess(_autograder.Action):
-    def __init__(self, name, command, timeout=None):
+    cost = {'cpu': 1}
+    def __init__(self, name, command, timeout=None, cost=None, max_output=None, spill=None, jobserver=False, limits=None):
         self.name = name
         self.command = command
         self.timeout = timeout
-    def perform(self, data, work_dir):
+        self.max_output = max_output
+        self.spill = spill
+        # hand the session's jobserver, if any, to a make-like command
+        self.jobserver = jobserver
+        # rlimits for the child, e.g. {'cpu': 10, 'memory': 2**30}; see _RLIMITS
+        self.limits = limits or {}
+        self._limiter = _rlimits(self.limits) if self.limits else []
+        if self.limits:
+            # measured now, rather than by the first step that needs it
+            _limiter_overhead()
+        if cost is not None:
+            self.cost = cost
+    @_contextlib.contextmanager
+    def _running(self, data, work_dir):
         result = {
             'operation': ' '.join(self.command),
             'output': '',
@@ -29,71 +283,219 @@ class Subprocess(_autograder.Action):
             'success': False,
         }
         data[self.name] = result
+        capture = _OutputCapture(self.max_output)
         try:
-            command = [find_command(self.command[0], path=work_dir)] + self.command[1:]
-            output = _subprocess.check_output(
-                command,
-                stderr=_subprocess.STDOUT,
-                universal_newlines=True,
-                cwd=work_dir,
-                timeout=self.timeout)
-            result['return_code'] = 0
-            result['output'] = output
-            result['success'] = True
-            return True
-        except _subprocess.CalledProcessError as e:
-            result['return_code'] = e.returncode
-            result['output'] = e.output
+            yield result, capture
         except FileNotFoundError:
-            result['output'] = 'File not found: {}'.format(command[0])
+            result['output'] = 'File not found: {}'.format(self.command[0])
         except _subprocess.TimeoutExpired:
             result['output'] = 'Timed out after: {}'.format(self.timeout)
         except Exception:
             result['output'] = _traceback.format_exc()
-        return False
+        finally:
+            if self.max_output is not None:
+                result['output_dropped'] = capture.dropped
+            if capture.spill is not None:
+                capture.spill.close()
+    def _prepare(self, result, capture, work_dir):
+        command = self._limiter + [find_command(self.command[0], path=work_dir)] + self.command[1:]
+        if self.spill is not None:
+            result['output_file'] = _path.join(work_dir, self.spill)
+            capture.spill = open(result['output_file'], 'wb')
+        return command
+    @_contextlib.contextmanager
+    def _spawning(self):
+        args = {}
+        jobserver = _scheduler.jobserver() if self.jobserver else None
+        if jobserver is None:
+            yield args
+            return
+        args.update(env=jobserver.environ(), pass_fds=jobserver.pass_fds())
+        # so tokens the child dies holding can be counted back in
+        with jobserver.lending():
+            yield args
+    def _finish(self, result, capture, return_code, wall, rusage=None, rss_floor=0):
+        overhead = _limiter_overhead() if self.limits else None
+        if overhead is not None:
+            # the interpreter that set the limits isn't the step's doing; its
+            # peak RSS also carries over into the command's, as ours does
+            result['timing'] = {'limiter': {k: overhead[k] for k in ('wall', 'cpu_user', 'cpu_system')}}
+            wall = max(wall - overhead['wall'], 0)
+            rss_floor = max(rss_floor, overhead['max_rss'])
+        else:
+            result['timing'] = {}
+        result['timing']['wall'] = wall
+        if rusage is not None:
+            result['timing'].update(
+                cpu_user=max(rusage.ru_utime - (overhead['cpu_user'] if overhead else 0), 0),
+                cpu_system=max(rusage.ru_stime - (overhead['cpu_system'] if overhead else 0), 0))
+            # linux starts a child's peak RSS at the size of the process that
+            # forked it, and keeps it across exec, so a peak no higher than
+            # ours was when it started may be ours, not the child's; it is
+            # left out rather than reported as the child's
+            if rusage.ru_maxrss > rss_floor:
+                # kilobytes on linux
+                result['timing']['max_rss'] = rusage.ru_maxrss*1024
+        result['return_code'] = return_code
+        result['output'] = capture.text()
+        result['success'] = return_code == 0
+        if self.limits:
+            # which limit the child ran into, if any, and which one its
+            # output makes it look like it did
+            result['limit_exceeded'] = _limit_exceeded(self.limits, return_code, rusage)
+            result['limit_suspected'] = _limit_suspected(self.limits, return_code, result['output'])
+    def perform(self, data, work_dir):
+        with self._running(data, work_dir) as (result, capture):
+            command = self._prepare(result, capture, work_dir)
+            start = _time.monotonic()
+            rss_floor = _own_max_rss()
+            with self._spawning() as args:
+                return_code, rusage = _run_captured(command, work_dir, self.timeout, capture, **args)
+            self._finish(result, capture, return_code, _time.monotonic() - start, rusage, rss_floor)
+        return data[self.name]['success']
+    async def perform_async(self, data, work_dir):
+        with self._running(data, work_dir) as (result, capture):
+            command = self._prepare(result, capture, work_dir)
+            start = _time.monotonic()
+            with self._spawning() as args:
+                return_code = await _run_captured_async(command, work_dir, self.timeout, capture, **args)
+            self._finish(result, capture, return_code, _time.monotonic() - start)
+        return data[self.name]['success']
 
 class Make(_autograder.Action):
-    def __init__(self, target):
+    # the one CPU slot is make's own first job; with a session jobserver it
+    # takes more from there for parallel jobs
+    cost = {'cpu': 1, 'memory': 256*_MiB}
+    def __init__(self, target, max_output=None):
         self._proc = Subprocess(
             name='make_'+target,
-            command=[find_command('make'), target])
+            command=[find_command('make'), target],
+            max_output=max_output,
+            jobserver=True)
     def perform(self, data, work_dir):
         return self._proc.perform(data, work_dir)
+    async def perform_async(self, data, work_dir):
+        return await self._proc.perform_async(data, work_dir)
 
-class CompileCXX(_autograder.Action):
-    def __init__(self, filename):
+class _CachedBuild(_autograder.Action):
+    cost = {'cpu': 1, 'memory': 256*_MiB}
+    @_abc.abstractmethod
+    def _key(self, work_dir):
+        pass
+    def _cached_proc(self, work_dir):
+        return self._proc
+    async def perform_async(self, data, work_dir):
+        if self.cache is None:
+            return await self._proc.perform_async(data, work_dir)
+        return await _scheduler.offload(self.perform, data, work_dir)
+    def perform(self, data, work_dir):
+        if self.cache is None:
+            return self._proc.perform(data, work_dir)
+        artifact = _path.join(work_dir, self.artifact)
+        try:
+            key = self._key(work_dir)
+        except Exception:
+            # let the real build report whatever is wrong
+            key = None
+        if key is not None:
+            output = self.cache.fetch(key, artifact)
+            if output is not None:
+                data[self._proc.name] = {
+                    'operation': ' '.join(self._proc.command),
+                    'output': output,
+                    'return_code': 0,
+                    'success': True,
+                    'cache_hits': 1,
+                    'cache_misses': 0,
+                }
+                return True
+        success = self._cached_proc(work_dir).perform(data, work_dir)
+        data[self._proc.name].update(cache_hits=0, cache_misses=1)
+        if success and key is not None:
+            self.cache.store(key, artifact, data[self._proc.name]['output'])
+        return success
+
+class CompileCXX(_CachedBuild):
+    def __init__(self, filename, cache=None):
         basename, _ = _path.splitext(filename)
+        self.compiler = find_command('g++', 'clang++')
+        self.flags = '-Wall -g --std=c++11'.split(' ')
+        self.filename = filename
+        self.artifact = basename+'.o'
+        self.cache = cache
         self._proc = Subprocess(
             name='compilecxx_'+basename,
-            command=[find_command('g++', 'clang++')] + '-c -Wall -g --std=c++11'.split(' ') + [filename, '-o', basename+'.o'])
-    def perform(self, data, work_dir):
-        return self._proc.perform(data, work_dir)
+            command=[self.compiler, '-c'] + self.flags + [filename, '-o', self.artifact])
+    def _cached_proc(self, work_dir):
+        # keep the per-submission directory out of the debug info, so objects
+        # built from the same source are byte-identical and link the same way
+        return Subprocess(
+            name=self._proc.name,
+            command=self._proc.command + ['-fdebug-prefix-map={}=.'.format(work_dir)])
+    def _key(self, work_dir):
+        # without -g, so the working directory is left out of the output
+        preprocessed = _subprocess.run(
+            [self.compiler, '-E'] + [f for f in self.flags if f != '-g'] + [self.filename],
+            stdout=_subprocess.PIPE,
+            stderr=_subprocess.DEVNULL,
+            cwd=work_dir)
+        if preprocessed.returncode != 0:
+            return None
+        return self.cache.key(
+            'compile',
+            self.cache.compiler_identity(self.compiler),
+            ' '.join(self.flags),
+            preprocessed.stdout)
 
-class LinkCXX(_autograder.Action):
-    def __init__(self, program, objects, libraries=[]):
+class LinkCXX(_CachedBuild):
+    def __init__(self, program, objects, libraries=[], cache=None):
+        self.compiler = find_command('g++', 'clang++')
+        self.flags = '-Wall -g --std=c++11'.split(' ')
+        self.objects = objects
+        self.artifact = program
+        self.cache = cache
         self._proc = Subprocess(
             name='linkcxx_'+program,
-            command=[find_command('g++', 'clang++')] + '-Wall -g --std=c++11'.split(' ') + objects + ['-o', program])
-    def perform(self, data, work_dir):
-        return self._proc.perform(data, work_dir)
+            command=[self.compiler] + self.flags + objects + ['-o', program])
+    def _key(self, work_dir):
+        parts = ['link', self.cache.compiler_identity(self.compiler), ' '.join(self.flags)]
+        for obj in self.objects:
+            with open(_path.join(work_dir, obj), 'rb') as f:
+                parts += [obj, _hashlib.sha256(f.read()).digest()]
+        return self.cache.key(*parts)
 
 class Valgrind(_autograder.Action):
-    def __init__(self, command, options=[]):
+    cost = {'cpu': 1, 'memory': 512*_MiB}
+    def __init__(self, command, options=[], max_output=None, limits=None):
         self.options = options
         self.command = command
+        self.max_output = max_output
+        self.limits = limits
+    def _proc(self, work_dir):
+        return Subprocess(
+            name='valgrind_{}'.format(self.command[0]),
+            command=[find_command('valgrind')] + self.options + [find_command(self.command[0], path=work_dir)] + self.command[1:],
+            max_output=self.max_output,
+            limits=self.limits)
+    def _not_found(self, data):
+        data['valgrind_{}'.format(self.command[0])] = {
+            'operation': 'valgrind {}'.format(self.command),
+            'success': False,
+            'output': _traceback.format_exc(),
+        }
+        return False
     def perform(self, data, work_dir):
         try:
-            proc = Subprocess(
-                name='valgrind_{}'.format(self.command[0]),
-                command=[find_command('valgrind')] + self.options + [find_command(self.command[0], path=work_dir)] + self.command[1:])
-            return proc.perform(data, work_dir)
+            proc = self._proc(work_dir)
         except NameError:
-            data['valgrind_{}'.format(self.command[0])] = {
-                'operation': 'valgrind {}'.format(self.command),
-                'success': False,
-                'output': _traceback.format_exc(),
-            }
-            return False
+            return self._not_found(data)
+        return proc.perform(data, work_dir)
+    async def perform_async(self, data, work_dir):
+        try:
+            proc = self._proc(work_dir)
+        except NameError:
+            return self._not_found(data)
+        return await proc.perform_async(data, work_dir)
 
 class ReadFile(_autograder.Action):
     def __init__(self, filename):
@@ -128,6 +530,7 @@ class WriteFile(_autograder.Action):
             'operation': 'write {}'.format(path),
         }
         try:
+            _staging.break_link(path)
             with open(_path.join(work_dir, self.filename), 'w') as f:
                 f.write(self.contents)
                 results['success'] = True
@@ -139,9 +542,22 @@ class WriteFile(_autograder.Action):
             data['read_'+self.filename] = results
             return False
 
+def _fingerprint_path(hasher, path):
+    if _path.isdir(path):
+        _cache.hash_tree(hasher, path)
+    elif _path.isfile(path):
+        _cache.hash_file(hasher, path)
+    else:
+        # missing now; the copy fails, and so should any cached pass
+        hasher.update(b'\0missing')
+    hasher.update(b'\0')
+
 class CopyFile(_autograder.Action):
     def __init__(self, filename):
         self.filename = filename
+    def fingerprint(self, hasher):
+        hasher.update(self.filename.encode('utf-8') + b'\0')
+        _fingerprint_path(hasher, _path.join(_os.getcwd(), self.filename))
     def perform(self, data, work_dir):
         results = {
             'success': False,
@@ -149,6 +565,7 @@ class CopyFile(_autograder.Action):
             'output': '',
         }
         try:
+            _staging.break_link(_path.join(work_dir, self.filename))
             _shutil.copy2(
                 src=_path.join(_os.getcwd(), self.filename),
                 dst=_path.join(work_dir, self.filename))
@@ -160,6 +577,46 @@ class CopyFile(_autograder.Action):
             data['copy_'+self.filename] = results
             return False
 
+class CopyGlobal(_autograder.Action):
+    # brings in something the session's global actions built, e.g. a test
+    # harness or library, instead of building it again for every submission
+    def __init__(self, filename, readonly=()):
+        self.filename = filename
+        # names matching these may be hard-linked to the shared copy rather
+        # than copied; only safe for files nothing in the submission writes
+        self.readonly = readonly
+    def fingerprint(self, hasher):
+        global_dir = _autograder.global_dir()
+        if global_dir is not None:
+            # by what it holds, since the global directory changes every run
+            hasher.update(self.filename.encode('utf-8') + b'\0')
+            _fingerprint_path(hasher, _path.join(global_dir, self.filename))
+    def perform(self, data, work_dir):
+        results = {
+            'success': False,
+            'operation': 'copy global {}'.format(self.filename),
+            'output': '',
+        }
+        try:
+            global_dir = _autograder.global_dir()
+            if global_dir is None:
+                raise RuntimeError('no global directory; is this running in a Session?')
+            src = _path.join(global_dir, self.filename)
+            dst = _path.join(work_dir, self.filename)
+            # a reflink where the filesystem can, which is a private copy
+            # either way; compilers and student code write files in place
+            if _path.isdir(src):
+                _staging.stage_tree(src, dst, 'link', readonly=self.readonly)
+            else:
+                _os.makedirs(_path.dirname(dst), exist_ok=True)
+                _staging.break_link(dst)
+                _staging.stage_file(src, dst, 'link', readonly=self.readonly)
+            results['success'] = True
+        except Exception:
+            results['output'] = _traceback.format_exc()
+        data['copy_global_'+self.filename] = results
+        return results['success']
+
 class ReadJSON(_autograder.Action):
     def __init__(self, filename):
         self.filename = filename
@@ -192,6 +649,7 @@ class WriteJSON(_autograder.Action):
             'operation': 'write {}'.format(path),
         }
         try:
+            _staging.break_link(path)
             with open(_path.join(work_dir, self.filename), 'w') as f:
                 _json.dump(data[self.filename], f)
                 results['success'] = True
@@ -247,7 +705,14 @@ class Call(_autograder.Action):
 class Try(_autograder.Action):
     def __init__(self, actions):
         self.actions = actions
+    def fingerprint(self, hasher):
+        for action in self.actions:
+            action.fingerprint(hasher)
     def perform(self, data, work_dir):
         for action in self.actions:
-            action.perform(data, work_dir)
+            _scheduler.perform(action, data, work_dir)
+        return True
+    async def perform_async(self, data, work_dir):
+        for action in self.actions:
+            await _scheduler.perform_async(action, data, work_dir)
         return True
@@ -0,0 +1,117 @@
+import hashlib as _hashlib
+import os as _os
+import os.path as _path
+import shutil as _shutil
+import subprocess as _subprocess
+import tempfile as _tempfile
+import threading as _threading
+
+def _entry_size(path):
+    try:
+        return _os.stat(path).st_size + _os.stat(path+'.out').st_size
+    except FileNotFoundError:
+        return 0
+
+class BuildCache:
+    def __init__(self, directory, max_size=1 << 30):
+        self.directory = directory
+        self.max_size = max_size
+        self._identities = {}
+        self._lock = _threading.Lock()
+        # what we think the cache holds, so a store only walks it when it
+        # may be over budget; unknown until the first walk
+        self._total = None
+        _os.makedirs(directory, exist_ok=True)
+
+    def compiler_identity(self, compiler):
+        # the same path can point at a different compiler after an upgrade, so
+        # key on what it says it is as well
+        with self._lock:
+            if compiler not in self._identities:
+                version = _subprocess.run(
+                    [compiler, '--version'],
+                    stdout=_subprocess.PIPE,
+                    stderr=_subprocess.STDOUT).stdout
+                self._identities[compiler] = compiler.encode('utf-8') + b'\0' + version
+            return self._identities[compiler]
+
+    def key(self, *parts):
+        h = _hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            h.update(part)
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _path(self, key):
+        return _path.join(self.directory, key[:2], key)
+
+    def fetch(self, key, dst):
+        path = self._path(key)
+        try:
+            with open(path+'.out') as f:
+                output = f.read()
+            if _path.exists(dst):
+                _os.unlink(dst)
+            _shutil.copy2(path, dst)
+            # mtime doubles as the last-used time for eviction
+            _os.utime(path)
+            return output
+        except FileNotFoundError:
+            return None
+
+    def store(self, key, src, output):
+        path = self._path(key)
+        replaced = _entry_size(path)
+        _os.makedirs(_path.dirname(path), exist_ok=True)
+        fd, tmp = _tempfile.mkstemp(dir=_path.dirname(path))
+        _os.close(fd)
+        try:
+            _shutil.copy2(src, tmp)
+            _os.replace(tmp, path)
+            with open(tmp, 'w') as f:
+                f.write(output)
+            _os.replace(tmp, path+'.out')
+        finally:
+            if _path.exists(tmp):
+                _os.unlink(tmp)
+        with self._lock:
+            if self._total is not None:
+                self._total += _entry_size(path) - replaced
+            over = self._total is None or self._total > self.max_size
+        if over:
+            self.evict()
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in _os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.out') or name.startswith('tmp'):
+                    continue
+                path = _path.join(dirpath, name)
+                try:
+                    st = _os.stat(path)
+                    out = _os.stat(path+'.out').st_size
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size + out, path))
+        return entries
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                for p in (path+'.out', path):
+                    try:
+                        _os.unlink(p)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+            self._total = total
@@ -1,6 +1,7 @@
 import autograder as _autograder
 import pystache as _pystache
 import os.path as _path
+import autograder.staging as _staging
 
 def _remove_dots(d):
     if isinstance(d, dict):
@@ -8,12 +9,71 @@ def _remove_dots(d):
     else:
         return d
 
+def _referenced_names(parsed):
+    # every name the template can look up, or None if a partial means we
+    # can't know
+    names = set()
+    for node in parsed._parse_tree:
+        if isinstance(node, str):
+            continue
+        if hasattr(node, 'indent'):
+            return None
+        key = getattr(node, 'key', None)
+        if key and key != '.':
+            names.update(key.split('.'))
+        for inner in (getattr(node, 'parsed', None), getattr(node, 'parsed_section', None)):
+            if inner is not None:
+                inner_names = _referenced_names(inner)
+                if inner_names is None:
+                    return None
+                names |= inner_names
+    return names
+
+def _view(value, names):
+    return _DataView(value, names) if isinstance(value, dict) else value
+
+class _DataView:
+    # what pystache sees instead of _remove_dots(data): keys are translated
+    # as they are looked up, and nothing is copied. Not a dict, so pystache
+    # falls back to attribute lookup.
+    __slots__ = ('_data', '_names', '_undotted')
+
+    def __init__(self, data, names):
+        self._data = data
+        self._names = names
+        self._undotted = None
+
+    def __getattr__(self, key):
+        if self._names is not None and key not in self._names:
+            raise AttributeError(key)
+        if self._undotted is None:
+            # only keys are scanned, and only those the template could want
+            self._undotted = {}
+            for k in self._data:
+                if '.' in k:
+                    name = k.replace('.', '_')
+                    if self._names is None or name in self._names:
+                        self._undotted[name] = k
+        if key in self._undotted:
+            return _view(self._data[self._undotted[key]], self._names)
+        if key in self._data:
+            return _view(self._data[key], self._names)
+        raise AttributeError(key)
+
+    def __bool__(self):
+        return bool(self._data)
+
+    def __str__(self):
+        return str(_remove_dots(self._data))
+
 class WriteTemplate(_autograder.Action):
     def __init__(self, template, filename):
         self.template = _pystache.parse(template)
+        self.names = _referenced_names(self.template)
         self.filename = filename
     def perform(self, data, work_dir):
-        result = _pystache.render(self.template, _remove_dots(data))
+        result = _pystache.render(self.template, _DataView(data, self.names))
+        _staging.break_link(_path.join(work_dir, self.filename))
         with open(_path.join(work_dir, self.filename), 'w') as f:
             f.write(result)
         data['write_template_{}'.format(self.filename)] = {
@@ -1,11 +1,72 @@
 import autograder as _autograder
 import argparse as _argparse
+import collections.abc as _abc
 import csv as _csv
+import hashlib as _hashlib
+import sys as _sys
+
+class _Columns:
+    # one list per column instead of one dict per row; repeated values
+    # (sections, TAs, ...) are interned so they are stored once
+    def __init__(self, headers):
+        self.headers = headers
+        self.columns = [[] for _ in headers]
+        self.length = 0
+    def append(self, row):
+        for column, item in zip(self.columns, row):
+            column.append(_sys.intern(item))
+        # short rows read as missing trailing fields, as zip() did before
+        for column in self.columns[len(row):]:
+            column.append(None)
+        self.length += 1
+    def row(self, i):
+        return {h: c[i] for h, c in zip(self.headers, self.columns) if c[i] is not None}
+    def value(self, i, header):
+        return self.columns[self.headers.index(header)][i]
+
+class CSVTable(_abc.Mapping):
+    def __init__(self, name, columns, index):
+        self.name = name
+        self._columns = columns
+        self._index = index
+    def __getitem__(self, key):
+        return self._columns.row(self._index[key])
+    def __iter__(self):
+        return iter(self._index)
+    def __len__(self):
+        return len(self._index)
+    def value(self, key, header):
+        return self._columns.value(self._index[key], header)
+    def __repr__(self):
+        return '<CSV table {}: {} rows>'.format(self.name, len(self))
+
+class CSVRows(_abc.Sequence):
+    def __init__(self, name, columns):
+        self.name = name
+        self._columns = columns
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._columns.row(i)
+    def __len__(self):
+        return self._columns.length
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, CSVRows)):
+            return NotImplemented
+        return list(self) == list(other)
+    def __repr__(self):
+        return '<CSV rows {}: {} rows>'.format(self.name, len(self))
 
 class CSVBackend(_autograder.Backend):
-    def __init__(self, name, key=None, **kwargs):
+    def __init__(self, name, key=None, attach=False, **kwargs):
         self.name = name
         self.key = key
+        # also put each submission's own row (keyed by its id) in its data
+        self.attach = attach
         self.requirements = {
             '{}-csv-input'.format(name): {
                 'type': _argparse.FileType('r')
@@ -17,21 +78,30 @@ class CSVBackend(_autograder.Backend):
         f = kwargs['{}_csv_input'.format(self.name)]
         self.reader = _csv.reader(f, **self.reader_kwargs)
         headers = next(self.reader)
+        columns = _Columns(headers)
+        digest = _hashlib.sha256(repr(headers).encode('utf-8'))
         if self.key is not None:
-            rows = {}
+            index = {}
             k_index = headers.index(self.key)
-        else:
-            rows = []
-            k_index = None
         for row in self.reader:
-            r = {}
-            for name, item in zip(headers, row):
-                r[name] = item
-            if k_index is not None:
-                rows[row[k_index]] = r
-            else:
-                rows.append(r)
-        self.rows = rows
+            digest.update(repr(row).encode('utf-8'))
+            if self.key is not None:
+                index[row[k_index]] = columns.length
+            columns.append(row)
+        if self.key is not None:
+            self.rows = CSVTable(self.name, columns, index)
+        else:
+            self.rows = CSVRows(self.name, columns)
+        self.digest = digest.digest()
 
     def prepare_global(self, data, global_dir):
+        # the table itself, not a copy; results.default writes it out as
+        # its rows, so a --run-from replay sees the same lookups
         data[self.name] = self.rows
+
+    def prepare(self, id, data, work_dir):
+        if self.attach and self.key is not None:
+            data[self.name] = self.rows.get(id)
+
+    def fingerprint(self, id, hasher):
+        hasher.update(self.digest)
@@ -2,7 +2,82 @@ import autograder as _autograder
 import os as _os
 import os.path as _path
 import datetime as _datetime
-import shutil as _shutil
+import json as _json
+import tempfile as _tempfile
+import autograder.cache as _cache
+import autograder.staging as _staging
+
+_MANIFEST_VERSION = 2
+_STAMP_FILES = ('DateSTAMP', 'DateSTAMP.LATE')
+
+def _stamp(st):
+    return [st.st_mtime_ns, st.st_ctime_ns]
+
+def _scan_submission(prefix, stamp):
+    # everything prepare needs from one submission, in one scandir pass
+    entry = {
+        # every directory, since adding a file only changes its own
+        # directory, and the stamp files, which may be rewritten in place
+        'stamps': {'.': stamp},
+        'stamp_files': {},
+        'is_late': False,
+        'timestamp': None,
+        'dirs': ['.'],
+        'files': [],
+    }
+    pending = ['.']
+    while pending:
+        rel = pending.pop()
+        with _os.scandir(_path.join(prefix, rel)) as it:
+            for e in it:
+                name = _path.join(rel, e.name)
+                # what os.walk would do: symlinked directories are neither
+                # walked nor staged
+                if e.is_dir():
+                    if not e.is_symlink():
+                        entry['dirs'].append(name)
+                        entry['stamps'][name] = _stamp(e.stat())
+                        pending.append(name)
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    # e.g. a dangling symlink; staging it fails this
+                    # submission, not the whole scan
+                    entry['files'].append([name, None, None])
+                    continue
+                entry['files'].append([name, st.st_size, st.st_mtime_ns])
+                if rel == '.' and e.name in _STAMP_FILES:
+                    entry['stamp_files'][e.name] = _stamp(st)
+                if rel == '.' and e.name == 'DateSTAMP.LATE':
+                    entry['is_late'] = True
+                    entry['timestamp'] = st.st_ctime
+                elif rel == '.' and e.name == 'DateSTAMP' and not entry['is_late']:
+                    entry['timestamp'] = st.st_ctime
+    return entry
+
+def _unchanged(prefix, entry, stamp):
+    # a stat per directory and stamp file, rather than one per file
+    if entry['stamps'].get('.') != stamp:
+        return False
+    try:
+        for rel, old in entry['stamps'].items():
+            if _stamp(_os.stat(_path.join(prefix, rel))) != old:
+                return False
+    except OSError:
+        return False
+    for name in _STAMP_FILES:
+        try:
+            current = _stamp(_os.stat(_path.join(prefix, name)))
+        except FileNotFoundError:
+            current = None
+        if entry['stamp_files'].get(name) != current:
+            return False
+    return True
+
+def _read_partners(filename):
+    with open(filename) as f:
+        return sorted(set(p.strip() for p in f))
 
 class HandinBackend(_autograder.Backend):
     name = 'handin'
@@ -12,53 +87,108 @@ class HandinBackend(_autograder.Backend):
         },
     }
 
-    def __init__(self, submission_name):
+    def __init__(self, submission_name, staging='copy', readonly=(), manifest=None):
         self.submission_name = submission_name
+        self.staging = staging
+        self.readonly = readonly
+        # where to keep the manifest between runs; a submission is only
+        # scanned again when one of its directories or stamp files changes
+        self.manifest_path = manifest
+        self.manifest = None
 
     def setup(self, handin_directory, **kwargs):
         self.handin_directory = handin_directory
 
+    def _load_manifest(self):
+        if self.manifest_path is not None:
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = _json.load(f)
+                if manifest.get('version') == _MANIFEST_VERSION:
+                    return manifest
+            except (OSError, ValueError):
+                pass
+        return {'version': _MANIFEST_VERSION, 'submissions': {}, 'partners': {}}
+
+    def _save_manifest(self):
+        directory = _path.dirname(_path.abspath(self.manifest_path))
+        fd, tmp = _tempfile.mkstemp(dir=directory)
+        with _os.fdopen(fd, 'w') as f:
+            _json.dump(self.manifest, f)
+        _os.replace(tmp, self.manifest_path)
+
+    def _refresh(self):
+        old = self._load_manifest()
+        manifest = {'version': _MANIFEST_VERSION, 'submissions': {}, 'partners': {}}
+        p = _path.join(self.handin_directory, self.submission_name)
+        with _os.scandir(p) as it:
+            for e in it:
+                if not e.is_dir():
+                    continue
+                stamp = _stamp(e.stat())
+                entry = old['submissions'].get(e.name)
+                if entry is None or not _unchanged(e.path, entry, stamp):
+                    entry = _scan_submission(e.path, stamp)
+                manifest['submissions'][e.name] = entry
+        partners = _path.join(self.handin_directory, self.submission_name+'.partner')
+        try:
+            it = _os.scandir(partners)
+        except FileNotFoundError:
+            it = None
+        if it is not None:
+            with it:
+                for e in it:
+                    if not e.is_file():
+                        continue
+                    stamp = e.stat().st_mtime_ns
+                    entry = old['partners'].get(e.name)
+                    if entry is None or entry[0] != stamp:
+                        entry = [stamp, _read_partners(e.path)]
+                    manifest['partners'][e.name] = entry
+        self.manifest = manifest
+        if self.manifest_path is not None:
+            self._save_manifest()
+
+    def _submission(self, id):
+        if self.manifest is None:
+            self._refresh()
+        entry = self.manifest['submissions'].get(id)
+        if entry is None:
+            raise FileNotFoundError(_path.join(self.handin_directory, self.submission_name, id))
+        return entry
+
     def prepare(self, id, data, work_dir):
         prefix = _path.join(self.handin_directory, self.submission_name, id)
-        # is_late
-        is_late = _path.exists(
-            _path.join(prefix, 'DateSTAMP.LATE'))
-        # submission_timestamp
-        if is_late:
-            timestamp_filename = 'DateSTAMP.LATE'
-        elif _path.exists(_path.join(prefix, 'DateSTAMP')):
-            timestamp_filename = 'DateSTAMP'
-        submission_timestamp = _datetime.datetime.fromtimestamp(
-            _os.stat(
-                _path.join(prefix, timestamp_filename)).st_ctime)
-        # partner id
-        partner_filename = _path.join(self.handin_directory, self.submission_name+'.partner', id)
-        if _path.isfile(partner_filename):
-            with open(partner_filename) as f:
-                partner_ids = set(p.strip() for p in f)
-        else:
-            partner_ids = set()
+        entry = self._submission(id)
+        if entry['timestamp'] is None:
+            raise FileNotFoundError(_path.join(prefix, 'DateSTAMP'))
+        _, partner_ids = self.manifest['partners'].get(id, (None, []))
 
         # copy over files
-        for f in _os.listdir(prefix):
-            fname = _path.join(prefix, f)
-            if _path.isdir(fname):
-                _shutil.copytree(src=fname, dst=_path.join(work_dir, f))
-            else:
-                _shutil.copy2(src=fname, dst=_path.join(work_dir, f))
-
+        try:
+            _staging.stage_tree(
+                prefix, work_dir, self.staging, self.readonly,
+                dirs=entry['dirs'], files=[name for name, _, _ in entry['files']])
+        except FileNotFoundError:
+            # resubmitted since the manifest was made; fall back to a walk
+            _staging.stage_tree(prefix, work_dir, self.staging, self.readonly)
 
         data.setdefault('meta',{}).update({
             'submitter_id': id,
-            'is_late': is_late,
-            'submission_timestamp': submission_timestamp,
+            'is_late': entry['is_late'],
+            'submission_timestamp': _datetime.datetime.fromtimestamp(entry['timestamp']),
             'partner_id': next(iter(partner_ids), None),
-            'source_dir': _path.join(self.handin_directory, self.submission_name, id),
+            'source_dir': prefix,
         })
 
+    def fingerprint(self, id, hasher):
+        _cache.hash_tree(hasher, _path.join(self.handin_directory, self.submission_name, id))
+        partner_filename = _path.join(self.handin_directory, self.submission_name+'.partner', id)
+        if _path.isfile(partner_filename):
+            with open(partner_filename, 'rb') as f:
+                hasher.update(f.read())
+
     def get_ids(self):
-        p = _path.join(self.handin_directory, self.submission_name)
-        dirs = _os.listdir(p)
-        return {
-            d for d in dirs
-            if _path.isdir(_path.join(p, d))}
+        # a fresh look at the handin directory every time ids are asked for
+        self._refresh()
+        return set(self.manifest['submissions'])
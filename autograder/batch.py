@@ -0,0 +1,83 @@
+import traceback as _traceback
+
+try:
+    import numpy as _numpy
+except ImportError:
+    # plain lists of floats; the grading function then has to loop itself
+    _numpy = None
+
+def column(values):
+    values = [float('nan') if v is None else float(v) for v in values]
+    if _numpy is not None:
+        return _numpy.array(values, dtype=float)
+    return values
+
+class BatchGrade:
+    def __init__(self, name, fields, fn, only_successful=True):
+        self.name = name
+        self.fields = fields
+        self.fn = fn
+        self.only_successful = only_successful
+
+    def wants(self, data):
+        return data.get('success', False) or not self.only_successful
+
+    def read(self, data):
+        row = {}
+        for field, read in self.fields.items():
+            try:
+                row[field] = read(data)
+            except (KeyError, IndexError, TypeError):
+                row[field] = None
+        return row
+
+    def grade(self, ids, rows):
+        # one column per field, in the same order as ids
+        table = {'id': list(ids)}
+        for field in self.fields:
+            table[field] = column([row[field] for row in rows])
+        grades = self.fn(table)
+        if _numpy is not None and isinstance(grades, _numpy.ndarray):
+            grades = grades.tolist()
+        grades = list(grades)
+        if len(grades) != len(table['id']):
+            raise ValueError('batch grade {} returned {} grades for {} submissions'.format(
+                self.name, len(grades), len(table['id'])))
+        return dict(zip(table['id'], grades))
+
+def run_batch(batches, submissions):
+    # one pass to build the columns, so only the requested fields of every
+    # submission are held in memory
+    ids = {batch.name: [] for batch in batches}
+    rows = {batch.name: [] for batch in batches}
+    for id, data in submissions.items():
+        for batch in batches:
+            if batch.wants(data):
+                ids[batch.name].append(id)
+                rows[batch.name].append(batch.read(data))
+    results = {}
+    for batch in batches:
+        try:
+            results[batch.name] = (batch.grade(ids[batch.name], rows[batch.name]), None)
+        except Exception:
+            results[batch.name] = ({id: None for id in ids[batch.name]}, _traceback.format_exc())
+    return results
+
+def apply_batch(results, id, data):
+    changed = False
+    for name, (grades, traceback) in results.items():
+        if id not in grades:
+            continue
+        changed = True
+        result = {
+            'success': traceback is None,
+            'operation': 'batch grade {}'.format(name),
+        }
+        if traceback is None:
+            data.setdefault('grades', {})[name] = grades[id]
+            result['output'] = str(grades[id])
+        else:
+            result['output'] = traceback
+            data['success'] = False
+        data['batch_grade_{}'.format(name)] = result
+    return changed
@@ -0,0 +1,13 @@
+import argparse as _argparse
+import autograder.results as _results
+
+def main():
+    parser = _argparse.ArgumentParser(description='convert between JSON and compact results files')
+    parser.add_argument('src')
+    parser.add_argument('dst')
+    parser.add_argument('--codec', choices=sorted(_results._CODECS), default=None, help='compression for a compact dst (default: gzip)')
+    args = parser.parse_args()
+    _results.convert(args.src, args.dst, codec=args.codec)
+
+if __name__ == '__main__':
+    main()
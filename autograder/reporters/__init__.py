@@ -2,3 +2,4 @@ from .csv import CSVReporter
 from autograder import _TerminalReporter as TerminalReporter
 from .email import SendAsEmailReporter
 from .stats import StatsReporter
+from .timing import TimingReporter
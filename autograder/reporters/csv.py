@@ -2,9 +2,12 @@ import csv as _csv
 import argparse as _argparse
 import autograder as _autograder
 import inspect as _inspect
+import os as _os
+import queue as _queue
+import threading as _threading
 
 class CSVReporter(_autograder.Reporter):
-    def __init__(self, name, row_fn, headings=None, **kwargs):
+    def __init__(self, name, row_fn, headings=None, batch_size=100, flush=True, fsync=False, sort_by_id=False, **kwargs):
         self.name = name
         self.requirements = {
             name+'-csv-output': {
@@ -13,6 +16,10 @@ class CSVReporter(_autograder.Reporter):
         }
         self.headings = headings
         self.row_fn = row_fn
+        self.batch_size = batch_size
+        self.flush = flush
+        self.fsync = fsync
+        self.sort_by_id = sort_by_id
         self.writer_kwargs = kwargs
     def setup(self, **kwargs):
         f = kwargs[self.name+'_csv_output']
@@ -20,13 +27,52 @@ class CSVReporter(_autograder.Reporter):
         self.writer = _csv.writer(f, **self.writer_kwargs)
         if self.headings is not None:
             self.writer.writerow(self.headings)
+        # grading threads only queue rows; this is the one thread that writes
+        self._queue = _queue.Queue()
+        self._error = None
+        self._thread = _threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+    def _write(self):
+        held = []
+        done = False
+        try:
+            while not done:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except _queue.Empty:
+                        break
+                if batch[-1] is None:
+                    done = True
+                    batch.pop()
+                if self.sort_by_id:
+                    held.extend(batch)
+                    continue
+                self._write_rows(rows for _, rows in batch)
+            if self.sort_by_id:
+                held.sort(key=lambda item: item[0])
+                self._write_rows(rows for _, rows in held)
+        except Exception as ex:
+            self._error = ex
+    def _write_rows(self, batches):
+        for rows in batches:
+            self.writer.writerows(rows)
+        if self.flush:
+            self.file.flush()
+            if self.fsync:
+                _os.fsync(self.file.fileno())
     def on_individual_completion(self, id, success, data, global_data):
         row = self.row_fn(id, success, data, global_data)
         if row is not None:
             if _inspect.isgenerator(row):
-                for r in row:
-                    self.writer.writerow(r)
+                rows = list(row)
             else:
-                self.writer.writerow(row)
+                rows = [row]
+            self._queue.put((id, rows))
     def on_completion(self, data):
+        self._queue.put(None)
+        self._thread.join()
         self.file.close()
+        if self._error is not None:
+            raise self._error
@@ -2,9 +2,31 @@ import autograder as _autograder
 
 import smtplib as _smtplib
 import email.mime.text as _mimetext
+import queue as _queue
+import threading as _threading
+import time as _time
+import json as _json
+import os as _os
+import os.path as _path
+import traceback as _traceback
+import urllib.parse as _parse
+
+def _worth_reconnecting(e):
+    if isinstance(e, _smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, _smtplib.SMTPResponseException):
+        # 421: service not available, closing transmission channel
+        return e.smtp_code == 421
+    # anything else smtplib raises is about the message, not the connection
+    return not isinstance(e, _smtplib.SMTPException)
+
+class _Connection:
+    def __init__(self):
+        self.smtp = None
+        self.sent = 0
 
 class SendAsEmailReporter(_autograder.Reporter):
-    def __init__(self, name, subject, filename, gen_addresses, dry_run=False, use_tls=False):
+    def __init__(self, name, subject, filename, gen_addresses, dry_run=False, use_tls=False, connections=1, messages_per_connection=None, rate_limit=None, queue_size=100):
         self.name = name
         self.subject = subject
         self.dry_run = dry_run
@@ -30,34 +52,151 @@ class SendAsEmailReporter(_autograder.Reporter):
                 'required': False,
                 'default': 0,
             },
+            '{}-email-spool'.format(name): {
+                'help': 'Directory to keep messages in until they are sent, so a crashed run can pick up where it left off. Ids already sent from it are never sent again, by any later run; empty its sent/ directory to send them anew.',
+                'required': False,
+                'default': None,
+            },
         }
         self.filename = filename
         self.gen_addresses = gen_addresses
         self.use_tls = use_tls
+        self.connections = connections
+        self.messages_per_connection = messages_per_connection
+        # messages per second, over all connections
+        self.rate_limit = rate_limit
+        self.queue_size = queue_size
     def setup(self, **kwargs):
         self.email_password = kwargs['{}_email_password'.format(self.name)]
         self.email_user = kwargs['{}_email_user'.format(self.name)]
         self.email_server = kwargs['{}_email_server'.format(self.name)]
         self.email_port = kwargs['{}_email_port'.format(self.name)]
         self.email_sender = kwargs['{}_email_sender'.format(self.name)]
+        self.spool = kwargs.get('{}_email_spool'.format(self.name))
+        # grading threads only render and enqueue; blocking when the queue is
+        # full keeps a slow server from piling up messages in memory
+        self._queue = _queue.Queue(maxsize=self.queue_size)
+        self._rate_lock = _threading.Lock()
+        self._next_send = 0
+        self._status_lock = _threading.Lock()
+        self.delivered = []
+        self.failed = []
+        # sent by an earlier run using the same spool
+        self.already_sent = []
+        # ids already queued from the spool, so a replay doesn't send them twice
+        self._spooled = set()
+        self._connections = [_Connection() for _ in range(self.connections)]
+        self._workers = [
+            _threading.Thread(target=self._deliver, args=(conn,), daemon=True)
+            for conn in self._connections]
+        for worker in self._workers:
+            worker.start()
+        if self.spool is not None:
+            for d in ('pending', 'sent'):
+                _os.makedirs(_path.join(self.spool, d), exist_ok=True)
+            # left over from a run that died before sending them
+            for name in sorted(_os.listdir(_path.join(self.spool, 'pending'))):
+                with open(_path.join(self.spool, 'pending', name)) as f:
+                    item = _json.load(f)
+                self._spooled.add(item['id'])
+                self._queue.put(item)
+    def _connect(self):
+        s = _smtplib.SMTP(self.email_server, self.email_port)
+        if self.use_tls:
+            s.starttls()
+        if self.email_user and self.email_password:
+            s.login(user=self.email_user, password=self.email_password)
+        return s
+    def _disconnect(self, conn):
+        if conn.smtp is not None:
+            try:
+                conn.smtp.quit()
+            except Exception:
+                conn.smtp.close()
+        conn.smtp = None
+        conn.sent = 0
+    def _throttle(self):
+        if self.rate_limit is None:
+            return
+        with self._rate_lock:
+            now = _time.monotonic()
+            wait = self._next_send - now
+            self._next_send = max(now, self._next_send) + 1/self.rate_limit
+        if wait > 0:
+            _time.sleep(wait)
+    def _send(self, conn, destinations, message):
+        if conn.smtp is None or (self.messages_per_connection is not None and conn.sent >= self.messages_per_connection):
+            self._disconnect(conn)
+            conn.smtp = self._connect()
+        self._throttle()
+        if self.dry_run:
+            print('''\
+Send mail
+=========
+From: {}
+To: {}
+Content:
+{}'''.format(self.email_sender, destinations, message))
+        else:
+            conn.smtp.sendmail(self.email_sender, destinations, message)
+        conn.sent += 1
+    def _spool_path(self, state, id):
+        return _path.join(self.spool, state, _parse.quote(id, safe=''))
+    def _deliver(self, conn):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._disconnect(conn)
+                return
+            try:
+                try:
+                    self._send(conn, item['destinations'], item['message'])
+                except OSError as e:
+                    if not _worth_reconnecting(e):
+                        raise
+                    # the server hung up on a connection we kept around; one more go
+                    self._disconnect(conn)
+                    self._send(conn, item['destinations'], item['message'])
+                if self.spool is not None:
+                    with open(self._spool_path('sent', item['id']), 'w'):
+                        pass
+                    try:
+                        _os.unlink(self._spool_path('pending', item['id']))
+                    except FileNotFoundError:
+                        pass
+            except Exception:
+                # this thread has to keep draining the queue, whatever happens
+                with self._status_lock:
+                    self.failed.append((item['id'], _traceback.format_exc()))
+                continue
+            with self._status_lock:
+                self.delivered.append(item['id'])
     def on_individual_completion(self, id, success, data, global_data):
+        if id in self._spooled:
+            return
+        if self.spool is not None and _path.exists(self._spool_path('sent', id)):
+            with self._status_lock:
+                self.already_sent.append(id)
+            return
         contents = _mimetext.MIMEText(data[self.filename], 'plain')
         destinations = list(self.gen_addresses(id, success, data, global_data))
         contents['Subject'] = self.subject
         contents['From'] = self.email_sender
         contents['To'] = ', '.join(destinations)
-        with _smtplib.SMTP(self.email_server, self.email_port) as s:
-            if self.use_tls:
-                s.starttls()
-            if self.email_user and self.email_password:
-                s.login(user=self.email_user, password=self.email_password)
-            if self.dry_run:
-                print('''\
-Send mail
-=========
-From: {}
-To: {}
-Content:
-{}'''.format(self.email_sender, destinations, contents.as_string()))
-            else:
-                s.sendmail(self.email_sender, destinations, contents.as_string())
+        item = {'id': id, 'destinations': destinations, 'message': contents.as_string()}
+        if self.spool is not None:
+            with open(self._spool_path('pending', id), 'w') as f:
+                _json.dump(item, f)
+        self._queue.put(item)
+    def on_completion(self, data):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        print('E-mail {}: {} sent, {} failed'.format(self.name, len(self.delivered), len(self.failed)))
+        if self.already_sent:
+            # never silently: a rerun meant to resend feedback sends nothing
+            print('E-mail {}: {} not sent again, as {} says they were sent before: {}'.format(
+                self.name, len(self.already_sent), _path.join(self.spool, 'sent'), ', '.join(sorted(self.already_sent))))
+        for id, trace in self.failed:
+            print('- {}: {}'.format(id, trace))
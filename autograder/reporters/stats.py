@@ -1,6 +1,153 @@
 import abc as _abc
+import bisect as _bisect
+import math as _math
+import threading as _threading
 import autograder as _autograder
 
+class Tally:
+    def __init__(self):
+        self.n = 0
+    def add(self, x):
+        self.n += 1
+    def merge(self, other):
+        self.n += other.n
+    def result(self):
+        return self.n
+
+class Moments:
+    # Welford's running mean and variance; merging is Chan et al.'s
+    # pairwise update
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self.m2 += delta*(x - self.mean)
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta*other.n/n
+        self.m2 += other.m2 + delta*delta*self.n*other.n/n
+        self.n = n
+    def result(self):
+        variance = self.m2/(self.n - 1) if self.n > 1 else 0.0
+        return {
+            'count': self.n,
+            'mean': self.mean if self.n else None,
+            'variance': variance,
+            'stddev': _math.sqrt(variance),
+        }
+
+class Extremes:
+    def __init__(self):
+        self.min = None
+        self.max = None
+    def add(self, x):
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+    def merge(self, other):
+        for x in (other.min, other.max):
+            if x is not None:
+                self.add(x)
+    def result(self):
+        return {'min': self.min, 'max': self.max}
+
+class FixedHistogram:
+    def __init__(self, lo, hi, bins):
+        self.edges = [lo + (hi - lo)*i/bins for i in range(bins + 1)]
+        self.counts = [0]*bins
+        self.under = 0
+        self.over = 0
+    def add(self, x):
+        if x < self.edges[0]:
+            self.under += 1
+        elif x > self.edges[-1]:
+            self.over += 1
+        else:
+            # the top edge belongs to the last bin
+            i = min(_bisect.bisect_right(self.edges, x), len(self.counts)) - 1
+            self.counts[i] += 1
+    def merge(self, other):
+        if other.edges != self.edges:
+            raise ValueError('cannot merge histograms with different bins')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.under += other.under
+        self.over += other.over
+    def result(self):
+        return {
+            'bins': [(lo, hi, n) for lo, hi, n in zip(self.edges, self.edges[1:], self.counts)],
+            'under': self.under,
+            'over': self.over,
+        }
+
+class TDigest:
+    # a merging t-digest: O(compression) centroids, finest near the tails
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []
+        self.buffer = []
+        self.total = 0
+        self.min = None
+        self.max = None
+    def add(self, x, weight=1):
+        self.buffer.append((x, weight))
+        self.total += weight
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        if len(self.buffer) >= 5*self.compression:
+            self._compress()
+    def merge(self, other):
+        for mean, weight in other.centroids + other.buffer:
+            self.add(mean, weight)
+        if other.min is not None:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+    def _compress(self):
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        if not points:
+            return
+        merged = []
+        before = 0
+        mean, weight = points[0]
+        for m, w in points[1:]:
+            q = (before + (weight + w)/2)/self.total
+            if weight + w <= 4*self.total*q*(1 - q)/self.compression:
+                weight += w
+                mean += (m - mean)*w/weight
+            else:
+                merged.append((mean, weight))
+                before += weight
+                mean, weight = m, w
+        merged.append((mean, weight))
+        self.centroids = merged
+    def quantile(self, q):
+        self._compress()
+        if not self.centroids:
+            return None
+        target = q*self.total
+        # interpolate between centroid centres, pinned to the extremes
+        prev_pos, prev_mean = 0, self.min
+        pos = 0
+        for mean, weight in self.centroids:
+            centre = pos + weight/2
+            if target <= centre:
+                if centre == prev_pos:
+                    return mean
+                return prev_mean + (mean - prev_mean)*(target - prev_pos)/(centre - prev_pos)
+            prev_pos, prev_mean = centre, mean
+            pos += weight
+        if pos == prev_pos:
+            return self.max
+        return prev_mean + (self.max - prev_mean)*(target - prev_pos)/(pos - prev_pos)
+
 class StatsReporter(_autograder.Reporter):
     requirements = {}
 
@@ -14,15 +161,79 @@ class StatsReporter(_autograder.Reporter):
         def accumulate(self, accumulator):
             pass
 
+    class StreamingOperation(Operation):
+        # folds values in as they arrive instead of being handed all of them
+        # at the end; accumulate() then gets the accumulator
+        def __init__(self, name, fn):
+            super().__init__(name)
+            self.fn = fn
+        def read(self, data, global_data):
+            return self.fn(data, global_data)
+        @_abc.abstractmethod
+        def accumulator(self):
+            pass
+        def accumulate(self, accumulator):
+            return accumulator.result()
+
+    class Count(StreamingOperation):
+        def accumulator(self):
+            return Tally()
+
+    class Mean(StreamingOperation):
+        def accumulator(self):
+            return Moments()
+
+    class MinMax(StreamingOperation):
+        def accumulator(self):
+            return Extremes()
+
+    class Histogram(StreamingOperation):
+        def __init__(self, name, fn, lo, hi, bins=10):
+            super().__init__(name, fn)
+            self.lo = lo
+            self.hi = hi
+            self.bins = bins
+        def accumulator(self):
+            return FixedHistogram(self.lo, self.hi, self.bins)
+
+    class Quantiles(StreamingOperation):
+        def __init__(self, name, fn, quantiles=(0.5, 0.9, 0.99), compression=100):
+            super().__init__(name, fn)
+            self.quantiles = quantiles
+            self.compression = compression
+        def accumulator(self):
+            return TDigest(self.compression)
+        def accumulate(self, accumulator):
+            return {q: accumulator.quantile(q) for q in self.quantiles}
+
     def __init__(self, operations):
         self.operations = operations
-        self.accumulators = {op.name: [] for op in operations}
+        self.accumulators = {
+            op.name: op.accumulator() if isinstance(op, StatsReporter.StreamingOperation) else []
+            for op in operations}
         self.item_count = 0
+        self.lock = _threading.Lock()
     def on_individual_completion(self, id, success, data, global_data):
         if success:
-            self.item_count += 1
+            values = [(op, op.read(data, global_data)) for op in self.operations]
+            with self.lock:
+                self.item_count += 1
+                for op, value in values:
+                    acc = self.accumulators[op.name]
+                    if isinstance(acc, list):
+                        acc.append(value)
+                    else:
+                        acc.add(value)
+    def merge(self, other):
+        # combine with a reporter over the same operations that saw other ids
+        with self.lock:
+            self.item_count += other.item_count
             for op in self.operations:
-                self.accumulators[op.name].append(op.read(data, global_data))
+                acc = self.accumulators[op.name]
+                if isinstance(acc, list):
+                    acc.extend(other.accumulators[op.name])
+                else:
+                    acc.merge(other.accumulators[op.name])
     def on_completion(self, data):
         print('Statistics (of {} successful items):'.format(self.item_count))
         for op in self.operations:
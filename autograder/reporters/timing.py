@@ -0,0 +1,49 @@
+import autograder as _autograder
+import collections as _collections
+import threading as _threading
+
+def _percentile(values, p):
+    # nearest rank, on already sorted values
+    return values[max(0, -(-len(values)*p//100) - 1)]
+
+class TimingReporter(_autograder.Reporter):
+    # max_rss only counts steps whose child grew past the grader's own peak
+    # RSS; below that, the kernel's figure can't be told apart from ours
+    requirements = {}
+    percentiles = (50, 90, 99)
+
+    def __init__(self):
+        self.samples = _collections.defaultdict(lambda: _collections.defaultdict(list))
+        self.lock = _threading.Lock()
+    def on_individual_completion(self, id, success, data, global_data):
+        with self.lock:
+            for name, d in data.items():
+                if not isinstance(d, dict):
+                    continue
+                if name == 'timing':
+                    for phase, seconds in d.items():
+                        self.samples[phase]['wall'].append(seconds)
+                elif 'success' in d and 'timing' in d:
+                    timing = d['timing']
+                    for k in ('wall', 'queued', 'max_rss'):
+                        if k in timing:
+                            self.samples[name][k].append(timing[k])
+                    if 'cpu_user' in timing:
+                        self.samples[name]['cpu'].append(timing['cpu_user'] + timing['cpu_system'])
+    def summary(self):
+        summary = {}
+        for name, fields in self.samples.items():
+            summary[name] = {}
+            for field, values in fields.items():
+                values = sorted(values)
+                summary[name][field] = dict(
+                    [('p{}'.format(p), _percentile(values, p)) for p in self.percentiles] +
+                    [('max', values[-1]), ('total', sum(values)), ('count', len(values))])
+        return summary
+    def on_completion(self, data):
+        print('Timing (seconds; max_rss in bytes, for steps that outgrew the grader):')
+        for name, fields in sorted(self.summary().items(), key=lambda i: -i[1]['wall']['total']):
+            print('{}:'.format(name))
+            for field, stats in fields.items():
+                print('  {}: {}'.format(field, ', '.join(
+                    '{}={:.6g}'.format(k, v) for k, v in stats.items())))
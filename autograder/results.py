@@ -0,0 +1,412 @@
+import collections.abc as _abc
+import json as _json
+import os as _os
+import re as _re
+import codecs as _codecs
+import gzip as _gzip
+import lzma as _lzma
+import struct as _struct
+
+def default(o):
+    # tables and lists that only look like dicts and lists (a CSV backend's
+    # roster, say) are written as what they hold, so a --run-from replay
+    # can still look things up in them; anything else as its repr
+    if isinstance(o, _abc.Mapping):
+        return dict(o)
+    if isinstance(o, _abc.Sequence) and not isinstance(o, (str, bytes, bytearray)):
+        return list(o)
+    return repr(o)
+
+class JSONLWriter:
+    def __init__(self, path, fsync=True, resume=False):
+        self.path = path
+        self.fsync = fsync
+        self.offsets = {}
+        if resume and _os.path.exists(path):
+            self._load()
+            self.file = open(path, 'a')
+        else:
+            self.file = open(path, 'w')
+
+    def _load(self):
+        offset = 0
+        with open(self.path, 'rb+') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    id = _json.loads(line.decode('utf-8'))['id']
+                except ValueError:
+                    # whatever was being written when the last run died
+                    f.truncate(offset)
+                    break
+                self.offsets[id] = offset
+                offset += len(line)
+
+    def write(self, id, data):
+        line = _json.dumps({'id': id, 'data': data}, default=default)
+        offset = self.file.tell()
+        self.file.write(line+'\n')
+        self.file.flush()
+        if self.fsync:
+            _os.fsync(self.file.fileno())
+        self.offsets[id] = offset
+
+    def submissions(self):
+        return JSONLSubmissions(self.path, self.offsets)
+
+    def close(self):
+        self.file.close()
+
+class JSONLSubmissions(_abc.Mapping):
+    # results stay on disk; only where each one starts is kept in memory
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+
+    def __getitem__(self, id):
+        offset = self.offsets[id]
+        with open(self.path) as f:
+            f.seek(offset)
+            return _json.loads(f.readline())['data']
+
+    def __iter__(self):
+        return iter(list(self.offsets))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, id):
+        # without reading the submission, as Mapping's would
+        return id in self.offsets
+
+    def items(self):
+        with open(self.path) as f:
+            for id, offset in list(self.offsets.items()):
+                f.seek(offset)
+                yield id, _json.loads(f.readline())['data']
+
+def _indent(s, level):
+    return s.replace('\n', '\n'+' '*level)
+
+def dump(results, f):
+    # the same document json.dump(results, f, indent=2, default=default) writes,
+    # but built one submission at a time. That output is pure ASCII, so
+    # counting characters gives the byte offset of every value.
+    index = {'keys': {}, 'submissions': {}}
+    written = 0
+    def write(s):
+        nonlocal written
+        f.write(s)
+        written += len(s)
+    write('{')
+    for i, (key, value) in enumerate(results.items()):
+        if i:
+            write(',')
+        write('\n  '+_json.dumps(key)+': ')
+        index['keys'][key] = written
+        if key == 'submissions':
+            write('{')
+            for j, (id, data) in enumerate(value.items()):
+                if j:
+                    write(',')
+                write('\n    '+_json.dumps(id)+': ')
+                index['submissions'][id] = written
+                write(_indent(_json.dumps(data, indent=2, default=default), 4))
+            write('\n  }' if len(value) else '}')
+        else:
+            write(_indent(_json.dumps(value, indent=2, default=default), 2))
+    write('\n}' if len(results) else '}')
+    return index
+
+class _Reader:
+    # just enough of a JSON tokenizer to walk the top two levels of a results
+    # document, decoding one value at a time with the stdlib decoder
+    _whitespace = _re.compile(r'[ \t\n\r]*')
+    _decoder = _json.JSONDecoder()
+    _chunk = 1 << 16
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        f.seek(offset)
+        self.base = offset
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.utf8 = _codecs.getincrementaldecoder('utf-8')()
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self._chunk)
+        if not chunk:
+            self.eof = True
+        self.buf += self.utf8.decode(chunk, final=self.eof)
+        return not self.eof
+
+    def offset(self):
+        # forget what has been consumed, so memory is bounded by one value
+        self.base += len(self.buf[:self.pos].encode('utf-8'))
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        return self.base
+
+    def skip(self):
+        while True:
+            self.pos = self._whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def next(self):
+        self.skip()
+        if self.pos >= len(self.buf):
+            raise ValueError('unexpected end of results file')
+        self.pos += 1
+        return self.buf[self.pos-1]
+
+    def peek(self):
+        self.skip()
+        return self.buf[self.pos] if self.pos < len(self.buf) else None
+
+    def expect(self, c):
+        if self.next() != c:
+            raise ValueError('expected {!r} at byte {}'.format(c, self.offset()))
+
+    def value(self):
+        self.skip()
+        size = self._chunk
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # a number could carry on in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            size *= 2
+
+    def items(self):
+        # (key, offset) for each member of the object here, leaving the
+        # caller to consume each value
+        self.expect('{')
+        if self.peek() == '}':
+            self.next()
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            self.skip()
+            yield key, self.offset()
+            c = self.next()
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError('expected \',\' or \'}\' at byte {}'.format(self.offset()))
+
+def _value_at(f, offset):
+    return _Reader(f, offset).value()
+
+def build_index(f):
+    index = {'keys': {}, 'submissions': {}}
+    reader = _Reader(f)
+    for key, offset in reader.items():
+        index['keys'][key] = offset
+        if key == 'submissions' and reader.peek() == '{':
+            for id, offset in reader.items():
+                index['submissions'][id] = offset
+                reader.value()
+        else:
+            reader.value()
+    return index
+
+def _index_path(path):
+    return path+'.idx'
+
+def _stamp(path):
+    st = _os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def save_index(path, index):
+    try:
+        with open(_index_path(path), 'w') as f:
+            _json.dump(dict(index, stamp=_stamp(path)), f)
+    except OSError:
+        pass
+
+def load_index(path):
+    try:
+        with open(_index_path(path)) as f:
+            index = _json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('stamp') != _stamp(path):
+        return None
+    return index
+
+class StreamedSubmissions(_abc.Mapping):
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+
+    def __getitem__(self, id):
+        offset = self.offsets[id]
+        with open(self.path, 'rb') as f:
+            return _value_at(f, offset)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, id):
+        # without reading the submission, as Mapping's would
+        return id in self.offsets
+
+    def items(self):
+        with open(self.path, 'rb') as f:
+            for id, offset in self.offsets.items():
+                yield id, _value_at(f, offset)
+
+def load(f, keep_index=True):
+    # a results document, JSON or compact, with only its submissions'
+    # offsets in memory; each submission is parsed when asked for. An index
+    # built along the way is saved next to the file unless keep_index is off.
+    try:
+        path = f.name
+        f.seekable() and _os.stat(path)
+    except (AttributeError, OSError, TypeError):
+        return _json.load(f)
+    if not isinstance(path, str) or not f.seekable():
+        return _json.load(f)
+    with open(path, 'rb') as raw:
+        if is_compact(raw):
+            return load_compact(path)
+    index = load_index(path)
+    with open(path, 'rb') as raw:
+        if index is None:
+            index = build_index(raw)
+            if keep_index:
+                save_index(path, index)
+        results = {}
+        for key, offset in index['keys'].items():
+            if key == 'submissions':
+                results[key] = StreamedSubmissions(path, index['submissions'])
+            else:
+                results[key] = _value_at(raw, offset)
+    return results
+
+# The compact format: a header naming the codec, then each top-level value
+# and each submission compressed on its own, then a compressed index of
+# where they all are, then a fixed-size footer pointing at the index.
+_MAGIC = b'autograder-results 1\n'
+_FOOTER = _struct.Struct('>Q8s')
+_FOOTER_MAGIC = b'agrindex'
+_CODECS = {
+    'gzip': (_gzip.compress, _gzip.decompress),
+    'lzma': (_lzma.compress, _lzma.decompress),
+}
+
+def dump_compact(results, f, codec='gzip'):
+    compress, _ = _CODECS[codec]
+    index = {'codec': codec, 'keys': [], 'submissions': {}}
+    written = 0
+    def write(value):
+        nonlocal written
+        record = compress(_json.dumps(value, default=default, separators=(',', ':')).encode('utf-8'))
+        f.write(record)
+        written += len(record)
+        return [written-len(record), len(record)]
+    header = _MAGIC+codec.encode('ascii')+b'\n'
+    f.write(header)
+    written += len(header)
+    for key, value in results.items():
+        if key == 'submissions':
+            for id, data in value.items():
+                index['submissions'][id] = write(data)
+            index['keys'].append([key, None])
+        else:
+            index['keys'].append([key, write(value)])
+    at = written
+    f.write(compress(_json.dumps(index).encode('utf-8')))
+    f.write(_FOOTER.pack(at, _FOOTER_MAGIC))
+
+def _read_record(f, decompress, where):
+    offset, length = where
+    f.seek(offset)
+    return _json.loads(decompress(f.read(length)).decode('utf-8'))
+
+def is_compact(f):
+    start = f.tell()
+    try:
+        return f.read(len(_MAGIC)) == _MAGIC
+    finally:
+        f.seek(start)
+
+class CompactSubmissions(_abc.Mapping):
+    def __init__(self, path, codec, index):
+        self.path = path
+        self.decompress = _CODECS[codec][1]
+        self.index = index
+
+    def __getitem__(self, id):
+        where = self.index[id]
+        with open(self.path, 'rb') as f:
+            return _read_record(f, self.decompress, where)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, id):
+        # without reading the submission, as Mapping's would
+        return id in self.index
+
+    def items(self):
+        with open(self.path, 'rb') as f:
+            for id, where in self.index.items():
+                yield id, _read_record(f, self.decompress, where)
+
+def load_compact(path):
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('{} is not a compact results file'.format(path))
+        codec = f.readline().decode('ascii').strip()
+        if codec not in _CODECS:
+            raise ValueError('{} uses unknown codec {!r}'.format(path, codec))
+        decompress = _CODECS[codec][1]
+        f.seek(-_FOOTER.size, _os.SEEK_END)
+        end = f.tell()
+        at, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != _FOOTER_MAGIC:
+            raise ValueError('{} has no index; was it written completely?'.format(path))
+        index = _read_record(f, decompress, [at, end-at])
+        results = {}
+        for key, where in index['keys']:
+            if key == 'submissions':
+                results[key] = CompactSubmissions(path, codec, index['submissions'])
+            else:
+                results[key] = _read_record(f, decompress, where)
+    return results
+
+def convert(src, dst, codec=None):
+    # compact to JSON, or JSON to compact with codec (gzip by default)
+    with open(src, 'rb') as f:
+        compact = is_compact(f)
+    if compact:
+        results = load_compact(src)
+        with open(dst, 'w') as f:
+            index = dump(results, f)
+        save_index(dst, index)
+    else:
+        with open(src) as f:
+            # nothing left behind next to the user's file
+            results = load(f, keep_index=False)
+        with open(dst, 'wb') as f:
+            dump_compact(results, f, codec=codec or 'gzip')
+
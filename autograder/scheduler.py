@@ -0,0 +1,409 @@
+import array as _array
+import asyncio as _asyncio
+import collections as _collections
+import collections.abc as _collections_abc
+import contextlib as _contextlib
+import contextvars as _contextvars
+import multiprocessing as _multiprocessing
+import os as _os
+import select as _select
+import threading as _threading
+import time as _time
+
+try:
+    import fcntl as _fcntl
+    import termios as _termios
+except ImportError:
+    _fcntl = _termios = None
+
+def _total_memory():
+    try:
+        return _os.sysconf('SC_PAGE_SIZE') * _os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def _open_nonblocking(fd):
+    # a second open of the pipe, so we can poll it without making the end
+    # make reads from non-blocking too (linux)
+    try:
+        return _os.open('/proc/self/fd/{}'.format(fd), _os.O_RDONLY | _os.O_NONBLOCK)
+    except OSError:
+        return None
+
+def _pipe_size(fd):
+    buf = _array.array('i', [0])
+    _fcntl.ioctl(fd, _termios.FIONREAD, buf)
+    return buf[0]
+
+class _ThreadWaiter:
+    def __init__(self, need):
+        self.need = need
+        self.got = 0
+        self.event = _threading.Event()
+    def cancelled(self):
+        return False
+    def deliver(self, jobserver):
+        self.event.set()
+
+class _AsyncWaiter:
+    def __init__(self, need, loop):
+        self.need = need
+        self.got = 0
+        self.loop = loop
+        self.future = loop.create_future()
+    def cancelled(self):
+        return self.future.cancelled()
+    def deliver(self, jobserver):
+        def resolve():
+            if self.future.cancelled():
+                jobserver.release(self.need)
+            else:
+                self.future.set_result(self.need)
+        try:
+            self.loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            # the loop is gone
+            jobserver.release(self.need)
+
+class Jobserver:
+    # a GNU make jobserver: a pipe holding one byte per free CPU slot. make
+    # and its sub-makes take a byte before starting each job beyond their
+    # first, and put it back when the job is done.
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.read_fd, self.write_fd = _os.pipe()
+        _os.write(self.write_fd, b'+'*tokens)
+        self._poll_fd = _open_nonblocking(self.read_fd)
+        # shared with forked workers: [tokens we have taken and not put
+        # back, children running with the pipe]
+        self._shared = _multiprocessing.Array('i', 2)
+        self._reader_pid = None
+        self._closed = False
+
+    def _start_reader(self):
+        # one thread per process takes tokens out of the pipe for every
+        # waiter, thread or task; started afresh in forked workers
+        if self._reader_pid == _os.getpid():
+            return
+        self._reader_pid = _os.getpid()
+        self._lock = _threading.Lock()
+        self._waiters = _collections.deque()
+        self._wake_r, self._wake_w = _os.pipe()
+        _os.set_blocking(self._wake_w, False)
+        _threading.Thread(target=self._read_tokens, daemon=True).start()
+
+    def _wake(self):
+        try:
+            _os.write(self._wake_w, b'!')
+        except BlockingIOError:
+            pass
+
+    def _read_tokens(self):
+        try:
+            while not self._closed:
+                with self._lock:
+                    wanted = bool(self._waiters)
+                fd = self._poll_fd if self._poll_fd is not None else self.read_fd
+                ready, _, _ = _select.select([self._wake_r] + ([fd] if wanted else []), [], [])
+                if self._wake_r in ready:
+                    _os.read(self._wake_r, 4096)
+                    self._reconcile()
+                if fd in ready and wanted:
+                    self._take()
+        except (OSError, ValueError):
+            # closed under us
+            pass
+
+    def _take(self):
+        if self._poll_fd is not None:
+            # read while holding the count, so _reconcile never sees a
+            # token in neither place
+            with self._shared.get_lock():
+                try:
+                    token = _os.read(self._poll_fd, 1)
+                except BlockingIOError:
+                    # make got there first
+                    return
+                self._shared[0] += len(token)
+        else:
+            token = _os.read(self.read_fd, 1)
+            with self._shared.get_lock():
+                self._shared[0] += len(token)
+        if not token:
+            return
+        give_back = 0
+        with self._lock:
+            while self._waiters and self._waiters[0].cancelled():
+                give_back += self._waiters.popleft().got
+            if self._waiters:
+                waiter = self._waiters[0]
+                waiter.got += 1
+                if waiter.got < waiter.need:
+                    waiter = None
+                else:
+                    self._waiters.popleft()
+            else:
+                waiter = None
+                give_back += 1
+        if give_back:
+            self.release(give_back)
+        if waiter is not None:
+            waiter.deliver(self)
+
+    def _reconcile(self):
+        # a make killed part way through never puts back the tokens it
+        # took; once nothing is running with the pipe, whatever is neither
+        # in it nor held by us was lost that way
+        if self._poll_fd is None or _termios is None:
+            return
+        with self._shared.get_lock():
+            if self._shared[1] != 0:
+                return
+            missing = self.tokens - self._shared[0] - _pipe_size(self.read_fd)
+            if missing > 0:
+                _os.write(self.write_fd, b'+'*missing)
+
+    def _wait_for(self, waiter):
+        self._start_reader()
+        with self._lock:
+            self._waiters.append(waiter)
+        self._wake()
+
+    def acquire(self, n):
+        waiter = _ThreadWaiter(n)
+        self._wait_for(waiter)
+        waiter.event.wait()
+        return n
+
+    async def acquire_async(self, n):
+        waiter = _AsyncWaiter(n, _asyncio.get_running_loop())
+        self._wait_for(waiter)
+        return await waiter.future
+
+    def release(self, n):
+        if n:
+            with self._shared.get_lock():
+                _os.write(self.write_fd, b'+'*n)
+                self._shared[0] -= n
+
+    @_contextlib.contextmanager
+    def lending(self):
+        # around running a child that is given the pipe
+        with self._shared.get_lock():
+            self._shared[1] += 1
+        try:
+            yield
+        finally:
+            with self._shared.get_lock():
+                self._shared[1] -= 1
+            if self._reader_pid == _os.getpid():
+                self._wake()
+            else:
+                self._reconcile()
+
+    def pass_fds(self):
+        return (self.read_fd, self.write_fd)
+
+    def environ(self, env=None):
+        env = dict(_os.environ if env is None else env)
+        fds = '{},{}'.format(self.read_fd, self.write_fd)
+        # the make being started counts as a job of ours already, so it
+        # runs its first job without a token, like any sub-make
+        flags = ' -j --jobserver-fds={} --jobserver-auth={}'.format(fds, fds)
+        env['MAKEFLAGS'] = env.get('MAKEFLAGS', '') + flags
+        return env
+
+    def close(self):
+        self._closed = True
+        fds = [self.read_fd, self.write_fd, self._poll_fd]
+        if self._reader_pid == _os.getpid():
+            self._wake()
+            fds += [self._wake_r, self._wake_w]
+        for fd in fds:
+            if fd is not None:
+                _os.close(fd)
+
+class _SharedCounts(_collections_abc.MutableMapping):
+    # a ResourcePool's available counts, in memory forked workers share
+    def __init__(self, counts):
+        self._keys = list(counts)
+        self._values = _multiprocessing.get_context('fork').Array('q', [counts[k] for k in self._keys], lock=False)
+    def __getitem__(self, k):
+        return self._values[self._keys.index(k)]
+    def __setitem__(self, k, v):
+        self._values[self._keys.index(k)] = v
+    def __delitem__(self, k):
+        raise TypeError('resources cannot be removed')
+    def __iter__(self):
+        return iter(self._keys)
+    def __len__(self):
+        return len(self._keys)
+
+class ResourcePool:
+    def __init__(self, cpus=None, memory=None, jobserver=False):
+        self.capacity = {
+            'cpu': cpus if cpus is not None else _multiprocessing.cpu_count(),
+            'memory': memory if memory is not None else _total_memory(),
+        }
+        # anything we can't measure isn't limited
+        self.capacity = {k: v for k, v in self.capacity.items() if v is not None}
+        self.available = dict(self.capacity)
+        self._cond = _threading.Condition()
+        self._async_waiters = []
+        # with a jobserver, CPU slots are its tokens, shared with the builds
+        # it is handed to (and with forked workers)
+        self.jobserver = Jobserver(self.capacity['cpu']) if jobserver else None
+
+    def share(self):
+        # before forking workers, so they all take from the one capacity
+        # rather than each from its own copy; CPU slots already are shared
+        # when they are jobserver tokens
+        if isinstance(self.available, _SharedCounts):
+            return
+        self.available = _SharedCounts(self.available)
+        self._cond = _multiprocessing.get_context('fork').Condition()
+
+    def _split(self, cost):
+        if self.jobserver is None:
+            return 0, cost
+        cost = dict(cost)
+        return cost.pop('cpu', 0), cost
+
+    def _clamp(self, cost):
+        # a single step asking for more than the machine has would otherwise
+        # wait forever; let it run alone instead
+        return {k: min(v, self.capacity[k]) for k, v in cost.items() if k in self.capacity and v}
+
+    def acquire(self, cost):
+        cost = self._clamp(cost)
+        # tokens first, so nothing waits for them while holding memory
+        tokens, cost = self._split(cost)
+        if tokens:
+            self.jobserver.acquire(tokens)
+        with self._cond:
+            self._cond.wait_for(lambda: all(self.available[k] >= v for k, v in cost.items()))
+            for k, v in cost.items():
+                self.available[k] -= v
+        return dict(cost, cpu=tokens) if tokens else cost
+
+    async def acquire_async(self, cost):
+        cost = self._clamp(cost)
+        tokens, cost = self._split(cost)
+        if tokens:
+            await self.jobserver.acquire_async(tokens)
+        loop = _asyncio.get_running_loop()
+        try:
+            while True:
+                with self._cond:
+                    if all(self.available[k] >= v for k, v in cost.items()):
+                        for k, v in cost.items():
+                            self.available[k] -= v
+                        return dict(cost, cpu=tokens) if tokens else cost
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                await waiter
+        except BaseException:
+            if tokens:
+                self.jobserver.release(tokens)
+            raise
+
+    def release(self, cost):
+        tokens, cost = self._split(cost)
+        if tokens:
+            self.jobserver.release(tokens)
+        with self._cond:
+            for k, v in cost.items():
+                self.available[k] += v
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        # releases can come from worker threads as well as the event loop
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    @_contextlib.contextmanager
+    def reserve(self, cost):
+        held = self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(held)
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+# context variables rather than thread locals, so each asyncio task sees
+# its own submission's settings as well
+_pool = _contextvars.ContextVar('pool', default=None)
+_executor = _contextvars.ContextVar('executor', default=None)
+
+@_contextlib.contextmanager
+def using(pool):
+    token = _pool.set(pool)
+    try:
+        yield
+    finally:
+        _pool.reset(token)
+
+@_contextlib.contextmanager
+def offloading_to(executor):
+    token = _executor.set(executor)
+    try:
+        yield
+    finally:
+        _executor.reset(token)
+
+def jobserver():
+    # the running session's jobserver, if it has one
+    pool = _pool.get()
+    return None if pool is None else pool.jobserver
+
+def offload(fn, *args):
+    # run blocking work off the event loop, keeping the caller's context
+    context = _contextvars.copy_context()
+    return _asyncio.get_running_loop().run_in_executor(_executor.get(), context.run, fn, *args)
+
+def _record(data, start, queued):
+    # the step's result is whatever it added last, as for reporters
+    if len(data) != 0:
+        _, result = list(data.items())[-1]
+        if isinstance(result, dict) and 'success' in result:
+            # nested steps (inside Try, or Subprocess itself) got there first
+            timing = result.setdefault('timing', {})
+            timing.setdefault('wall', _time.monotonic() - start)
+            timing.setdefault('queued', queued)
+
+def _timed(action, data, work_dir, queued):
+    start = _time.monotonic()
+    try:
+        return action.perform(data, work_dir)
+    finally:
+        _record(data, start, queued)
+
+def perform(action, data, work_dir):
+    pool = _pool.get()
+    cost = getattr(action, 'cost', None)
+    if pool is None or not cost:
+        return _timed(action, data, work_dir, 0)
+    start = _time.monotonic()
+    with pool.reserve(cost):
+        return _timed(action, data, work_dir, _time.monotonic() - start)
+
+async def _timed_async(action, data, work_dir, queued):
+    start = _time.monotonic()
+    try:
+        return await action.perform_async(data, work_dir)
+    finally:
+        _record(data, start, queued)
+
+async def perform_async(action, data, work_dir):
+    pool = _pool.get()
+    cost = getattr(action, 'cost', None)
+    if pool is None or not cost:
+        return await _timed_async(action, data, work_dir, 0)
+    start = _time.monotonic()
+    held = await pool.acquire_async(cost)
+    try:
+        return await _timed_async(action, data, work_dir, _time.monotonic() - start)
+    finally:
+        pool.release(held)
@@ -0,0 +1,71 @@
+import errno as _errno
+import fnmatch as _fnmatch
+import os as _os
+import os.path as _path
+import shutil as _shutil
+
+try:
+    import fcntl as _fcntl
+except ImportError:
+    _fcntl = None
+
+# linux/fs.h
+_FICLONE = 0x40049409
+
+def reflink(src, dst):
+    if _fcntl is None:
+        raise OSError(_errno.EOPNOTSUPP, 'reflinks are not supported here', dst)
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            _fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            _os.unlink(dst)
+            raise
+    _shutil.copystat(src, dst)
+
+def stage_file(src, dst, mode='copy', readonly=()):
+    if mode == 'link':
+        try:
+            reflink(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+        # a hard link shares the inode with the handin directory, so only
+        # files nothing is expected to write to may be staged this way
+        if any(_fnmatch.fnmatch(_path.basename(src), p) for p in readonly):
+            try:
+                _os.link(src, dst)
+                return 'link'
+            except OSError:
+                pass
+    _shutil.copy2(src, dst)
+    return 'copy'
+
+def stage_tree(src, dst, mode='copy', readonly=(), dirs=None, files=None):
+    # dirs and files, relative to src, save walking it when they are
+    # already known
+    if mode not in ('copy', 'link'):
+        raise ValueError('unknown staging mode: {}'.format(mode))
+    counts = {'copy': 0, 'reflink': 0, 'link': 0}
+    if dirs is None or files is None:
+        dirs, files = [], []
+        for dirpath, dirnames, filenames in _os.walk(src):
+            rel = _path.relpath(dirpath, src)
+            dirs.append(rel)
+            files.extend(_path.join(rel, name) for name in filenames)
+    for rel in dirs:
+        _os.makedirs(_path.join(dst, rel), exist_ok=True)
+    for rel in files:
+        how = stage_file(_path.join(src, rel), _path.join(dst, rel), mode, readonly)
+        counts[how] += 1
+    return counts
+
+def break_link(path):
+    # copy-on-write for hard-linked staging: anything about to overwrite a
+    # file gets a private one instead of writing through to the original
+    try:
+        if _os.stat(path).st_nlink > 1:
+            _os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,90 @@
+from autograder.actions import BuildCache, CompileCXX, LinkCXX
+
+import os
+import os.path
+import shutil
+import tempfile
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('g++') is None and shutil.which('clang++') is None,
+    reason='no C++ compiler')
+
+@pytest.fixture
+def cache():
+    with tempfile.TemporaryDirectory() as d:
+        yield BuildCache(d)
+
+def make_work_dir(contents):
+    d = tempfile.TemporaryDirectory()
+    with open(os.path.join(d.name, 'main.cpp'), 'w') as f:
+        f.write(contents)
+    return d
+
+def test__compile_cache_hit(cache):
+    results = []
+    for _ in range(2):
+        with make_work_dir('int main() { return 0; }\n') as work_dir:
+            data = {}
+            assert CompileCXX('main.cpp', cache=cache).perform(data, work_dir)
+            assert LinkCXX('main', ['main.o'], cache=cache).perform(data, work_dir)
+            assert os.path.isfile(os.path.join(work_dir, 'main.o'))
+            assert os.access(os.path.join(work_dir, 'main'), os.X_OK)
+            results.append(data)
+    assert [(d['compilecxx_main']['cache_hits'], d['compilecxx_main']['cache_misses']) for d in results] == [(0, 1), (1, 0)]
+    assert [d['linkcxx_main']['cache_hits'] for d in results] == [0, 1]
+
+def test__compile_cache_miss_on_change(cache):
+    for source in ['int main() { return 0; }\n', 'int main() { return 1; }\n']:
+        with make_work_dir(source) as work_dir:
+            data = {}
+            assert CompileCXX('main.cpp', cache=cache).perform(data, work_dir)
+            assert data['compilecxx_main']['cache_misses'] == 1
+
+def test__compile_failure_not_cached(cache):
+    for _ in range(2):
+        with make_work_dir('int main() { return }\n') as work_dir:
+            data = {}
+            assert not CompileCXX('main.cpp', cache=cache).perform(data, work_dir)
+            assert data['compilecxx_main']['cache_misses'] == 1
+            assert 'error' in data['compilecxx_main']['output']
+
+def test__evict_least_recently_used():
+    with tempfile.TemporaryDirectory() as d, tempfile.TemporaryDirectory() as src:
+        cache = BuildCache(os.path.join(d, 'cache'), max_size=250)
+        keys = []
+        for i in range(3):
+            path = os.path.join(src, str(i))
+            with open(path, 'w') as f:
+                f.write('x'*100)
+            key = cache.key(str(i))
+            cache.store(key, path, '')
+            os.utime(cache._path(key), (i, i))
+            keys.append(key)
+        cache.evict()
+        assert cache.fetch(keys[0], os.path.join(src, 'out')) is None
+        assert cache.fetch(keys[2], os.path.join(src, 'out')) == ''
+        assert cache.size() <= 250
+
+def test__store_only_walks_when_over_budget():
+    from unittest import mock
+    with tempfile.TemporaryDirectory() as d, tempfile.TemporaryDirectory() as src:
+        cache = BuildCache(os.path.join(d, 'cache'), max_size=350)
+        path = os.path.join(src, 'artifact')
+        with open(path, 'w') as f:
+            f.write('x'*100)
+        with mock.patch.object(cache, '_entries', wraps=cache._entries) as entries:
+            for i in range(3):
+                cache.store(cache.key(str(i)), path, '')
+            # once to learn the size, then not again while under budget
+            assert entries.call_count == 1
+            cache.store(cache.key('3'), path, '')
+            assert entries.call_count == 2
+        assert cache.size() <= 350
+
+def test__cached_build_needs_a_key():
+    from autograder.actions import _CachedBuild
+    class Build(_CachedBuild):
+        pass
+    with pytest.raises(TypeError):
+        Build()
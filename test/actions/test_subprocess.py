@@ -0,0 +1,164 @@
+from autograder.actions import Subprocess
+
+import os.path
+import shutil
+import sys
+import tempfile
+import pytest
+
+@pytest.fixture
+def work_dir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+def test__success(work_dir):
+    data = {}
+    assert Subprocess('p', python('print("a\\r\\nb")')).perform(data, work_dir)
+    assert data['p']['output'] == 'a\nb\n'
+    assert data['p']['return_code'] == 0
+    assert 'output_dropped' not in data['p']
+
+def test__failure(work_dir):
+    data = {}
+    assert not Subprocess('p', python('import sys; print("x"); sys.exit(3)')).perform(data, work_dir)
+    assert data['p']['output'] == 'x\n'
+    assert data['p']['return_code'] == 3
+    assert not data['p']['success']
+
+def test__timeout(work_dir):
+    data = {}
+    assert not Subprocess('p', python('import time\nwhile True: print("spam", flush=True)'), timeout=0.5, max_output=100).perform(data, work_dir)
+    assert data['p']['output'] == 'Timed out after: 0.5'
+    assert data['p']['output_dropped'] > 0
+
+def test__max_output(work_dir):
+    data = {}
+    p = Subprocess('p', python('print("head" + "x"*100000 + "tail", end="")'), max_output=100)
+    assert p.perform(data, work_dir)
+    out = data['p']['output']
+    assert out.startswith('head')
+    assert out.endswith('tail')
+    assert data['p']['output_dropped'] == 100008 - 100
+    assert '[... 99908 bytes dropped ...]' in out
+
+def test__spill(work_dir):
+    data = {}
+    p = Subprocess('p', python('print("x"*1000, end="")'), max_output=10, spill='p.log')
+    assert p.perform(data, work_dir)
+    assert data['p']['output_file'] == os.path.join(work_dir, 'p.log')
+    with open(data['p']['output_file']) as f:
+        assert f.read() == 'x'*1000
+    assert data['p']['output_dropped'] == 990
+
+def test__timing(work_dir):
+    data = {}
+    assert Subprocess('p', python('x = b"x"*(300*2**20)')).perform(data, work_dir)
+    timing = data['p']['timing']
+    assert timing['wall'] > 0
+    assert timing['cpu_user'] + timing['cpu_system'] > 0
+    assert timing['max_rss'] >= 300*2**20
+
+def test__timing_leaves_out_our_own_rss(work_dir):
+    # a child's peak starts out at ours, so without the floor this would
+    # report at least the 200MiB held here
+    held = b'x'*(200*2**20)
+    data = {}
+    assert Subprocess('p', [shutil.which('true')]).perform(data, work_dir)
+    assert 'max_rss' not in data['p']['timing']
+    assert 'cpu_user' in data['p']['timing']
+    del held
+
+def test__perform_async(work_dir):
+    import asyncio
+    data = {}
+    assert asyncio.run(Subprocess('p', python('print("a")'), max_output=100).perform_async(data, work_dir))
+    assert data['p']['output'] == 'a\n'
+    assert data['p']['output_dropped'] == 0
+
+def test__perform_async_timeout(work_dir):
+    import asyncio
+    data = {}
+    assert not asyncio.run(Subprocess('p', python('import time; time.sleep(10)'), timeout=0.2).perform_async(data, work_dir))
+    assert data['p']['output'] == 'Timed out after: 0.2'
+
+def test__make_uses_jobserver(work_dir):
+    import autograder
+    from autograder import actions, scheduler
+    # each target waits for the other to have started, so this only
+    # succeeds if make runs them side by side
+    with open(os.path.join(work_dir, 'Makefile'), 'w') as f:
+        f.write('all: a b\n')
+        for me, other in (('a', 'b'), ('b', 'a')):
+            f.write('{0}:\n\ttouch {0}.started; for i in $$(seq 100); do test -e {1}.started && exit 0; sleep 0.05; done; exit 1\n'.format(me, other))
+    pool = scheduler.ResourcePool(cpus=2, jobserver=True)
+    try:
+        data = {}
+        with scheduler.using(pool):
+            assert scheduler.perform(actions.Make('all'), data, work_dir), data['make_all']['output']
+        # make gave back the token it borrowed
+        assert pool.jobserver.acquire(2) == 2
+    finally:
+        pool.jobserver.close()
+
+def test__killed_make_tokens_come_back(work_dir):
+    from autograder import actions, scheduler
+    # every job sits on a token until make is killed
+    with open(os.path.join(work_dir, 'Makefile'), 'w') as f:
+        f.write('all: a b c\n')
+        for name in 'abc':
+            f.write('{}:\n\tsleep 30\n'.format(name))
+    pool = scheduler.ResourcePool(cpus=3, jobserver=True)
+    try:
+        data = {}
+        make = actions.Subprocess('make_all', [shutil.which('make'), 'all'], timeout=1, jobserver=True)
+        with scheduler.using(pool):
+            assert not scheduler.perform(make, data, work_dir)
+        assert data['make_all']['output'].startswith('Timed out')
+        assert pool.jobserver.acquire(3) == 3
+    finally:
+        pool.jobserver.close()
+
+@pytest.mark.parametrize('limits,command,exceeded,suspected', [
+    ({'cpu': 1}, python('while True: pass'), 'cpu', None),
+    ({'memory': 2**30}, python('x = bytearray(4*2**30)'), None, 'memory'),
+    # python ignores SIGXFSZ, so it only says so
+    ({'file_size': 2**20}, python('open("big", "wb").write(bytes(2**21))'), None, 'file_size'),
+    ({'file_size': 2**20}, [shutil.which('sh'), '-c', 'exec head -c 2097152 /dev/zero > big'], 'file_size', None),
+    ({'open_files': 32}, python('fs = [open("f", "w") for _ in range(64)]'), None, 'open_files'),
+    # a shell reports a command SIGXFSZ killed by exiting with 128+SIGXFSZ
+    ({'file_size': 2**20}, [shutil.which('sh'), '-c', 'head -c 2097152 /dev/zero > big; exit $?'], 'file_size', 'file_size'),
+    ({'cpu': 10, 'open_files': 32}, python('print("fine")'), None, None),
+])
+def test__limits(work_dir, limits, command, exceeded, suspected):
+    data = {}
+    s = Subprocess('limited', command, timeout=30, limits=limits)
+    assert s.perform(data, work_dir) == (exceeded is None and suspected is None)
+    assert data['limited']['limit_exceeded'] == exceeded
+    assert data['limited']['limit_suspected'] == suspected
+
+def test__limits_are_not_taken_from_output(work_dir):
+    data = {}
+    s = Subprocess('limited', python('import sys; sys.exit("out of memory")'), limits={'memory': 2**30})
+    assert not s.perform(data, work_dir)
+    assert data['limited']['limit_exceeded'] is None
+    assert data['limited']['limit_suspected'] == 'memory'
+
+def test__limiter_overhead_taken_out(work_dir):
+    from unittest import mock
+    from autograder import actions
+    assert actions._limiter_overhead()['wall'] > 0
+    cost = {'wall': 100, 'cpu_user': 100, 'cpu_system': 100, 'max_rss': 2**40}
+    data = {}
+    with mock.patch.object(actions, '_limiter_overhead', return_value=cost):
+        assert Subprocess('limited', python('pass'), limits={'cpu': 10}).perform(data, work_dir)
+    timing = data['limited']['timing']
+    assert timing['limiter'] == {'wall': 100, 'cpu_user': 100, 'cpu_system': 100}
+    assert timing['wall'] == timing['cpu_user'] == timing['cpu_system'] == 0
+    assert 'max_rss' not in timing
+
+def test__unknown_limit():
+    with pytest.raises(ValueError):
+        Subprocess('limited', ['true'], limits={'gpus': 1})
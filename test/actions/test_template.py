@@ -0,0 +1,44 @@
+from autograder.actions import template
+
+import pystache
+import tempfile
+import os.path
+import pytest
+
+DATA = {
+    'success': True,
+    'compile_main.cpp': {'success': False, 'output': 'main.cpp:1: <error>'},
+    'grades': {'part.a': 3, 'part_b': 4},
+    'empty': {},
+    'tests': [{'name': 'one'}, {'name': 'two'}],
+    'huge': {'x.y': 'z'*1000},
+}
+
+@pytest.mark.parametrize('source', [
+    '{{success}} {{compile_main_cpp.output}} {{{compile_main_cpp.output}}}',
+    '{{#grades}}{{part_a}}/{{part_b}}{{/grades}}',
+    '{{#empty}}never{{/empty}}{{^empty}}empty{{/empty}}{{^missing}}missing{{/missing}}',
+    '{{#tests}}{{name}},{{/tests}}',
+    '{{#compile_main_cpp}}{{^success}}failed: {{output}}{{/success}}{{/compile_main_cpp}}',
+    '{{grades}}',
+])
+def test__matches_remove_dots(source):
+    expected = pystache.render(pystache.parse(source), template._remove_dots(DATA))
+    with tempfile.TemporaryDirectory() as d:
+        t = template.WriteTemplate(source, 'out.txt')
+        data = dict(DATA)
+        assert t.perform(data, d)
+        with open(os.path.join(d, 'out.txt')) as f:
+            assert f.read() == expected
+    assert 'write_template_out.txt' in data
+
+def test__referenced_names():
+    t = template.WriteTemplate('{{a.b}}{{#c}}{{d}}{{^e}}{{.}}{{/e}}{{/c}}', 'out.txt')
+    assert t.names == {'a', 'b', 'c', 'd', 'e'}
+    assert template.WriteTemplate('{{>partial}}', 'out.txt').names is None
+
+def test__view_only_scans_keys():
+    view = template._DataView(DATA, {'huge', 'x_y'})
+    assert view.huge.x_y == 'z'*1000
+    with pytest.raises(AttributeError):
+        view.success
@@ -37,3 +37,50 @@ def test__basic_no_key():
         {'x': '4', 'y': '5', 'z': '6'},
         {'x': '7', 'y': '8', 'z': '9'},
     ]}
+
+def test__global_data_is_a_reference():
+    b = CSVBackend(name='foo', key='y', delimiter=',')
+    b.setup(foo_csv_input=['x,y,z', '1,2,3', '4,5,6'])
+    data = {}
+    b.prepare_global(data, None)
+    assert data['foo'] is b.rows
+    assert data['foo'].value('5', 'z') == '6'
+    assert repr(data['foo']) == '<CSV table foo: 2 rows>'
+
+def test__attach_row():
+    b = CSVBackend(name='foo', key='y', attach=True, delimiter=',')
+    b.setup(foo_csv_input=['x,y,z', '1,2,3', '4,5,6'])
+    data = {}
+    with tempfile.TemporaryDirectory() as d:
+        b.prepare('5', data, d)
+        assert data == {'foo': {'x': '4', 'y': '5', 'z': '6'}}
+        b.prepare('7', data, d)
+        assert data == {'foo': None}
+
+def test__rows_sequence():
+    b = CSVBackend(name='foo', delimiter=',')
+    b.setup(foo_csv_input=['x,y', '1,2', '3'])
+    assert b.rows[-1] == {'x': '3'}
+    assert b.rows[:1] == [{'x': '1', 'y': '2'}]
+    assert len(b.rows) == 2
+
+@pytest.mark.parametrize('key', ['y', None])
+def test__results_keep_rows_for_replay(key):
+    import io
+    from unittest import mock
+    import autograder
+    from autograder import results
+    b = CSVBackend(name='foo', key=key, delimiter=',')
+    b.setup(foo_csv_input=['x,y,z', '1,2,3', '4,5,6'])
+    data = {}
+    b.prepare_global(data, None)
+    data['submissions'] = {'5': {'success': True}}
+    f = io.StringIO()
+    results.dump(data, f)
+
+    reporter = mock.create_autospec(autograder.Reporter)
+    loaded = results.load(io.StringIO(f.getvalue()))
+    autograder.Session([], [reporter], []).run_from_results(loaded)
+
+    global_data = reporter.on_individual_completion.call_args[0][3]
+    assert global_data['foo'] == (b.rows if key is None else dict(b.rows))
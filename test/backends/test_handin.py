@@ -55,3 +55,67 @@ def test__prepare(id, expected_meta, backend, my_tmpdir):
     assert data['meta'] == expected_meta
 
     assert set(os.listdir(str(my_tmpdir))) == {stamp_name, id}
+
+def test__manifest_persisted(datadir, my_tmpdir):
+    import shutil
+    from autograder.backends import handin
+    handin_dir = os.path.join(my_tmpdir, 'handin_dir')
+    shutil.copytree(datadir['handin_dir'], handin_dir)
+    manifest = os.path.join(my_tmpdir, 'manifest.json')
+    b = HandinBackend(submission_name='bar', manifest=manifest)
+    b.setup(handin_directory=handin_dir)
+    assert b.get_ids() == {'1', '2', '3'}
+    assert os.path.exists(manifest)
+
+    # unchanged submissions come from the saved manifest, not a new scan
+    b = HandinBackend(submission_name='bar', manifest=manifest)
+    b.setup(handin_directory=handin_dir)
+    scans = []
+    scan = handin._scan_submission
+    def counting(prefix, stamp):
+        scans.append(prefix)
+        return scan(prefix, stamp)
+    handin._scan_submission = counting
+    try:
+        assert b.get_ids() == {'1', '2', '3'}
+        assert scans == []
+        with open(os.path.join(handin_dir, 'bar', '1', 'new.txt'), 'w') as f:
+            f.write('resubmitted')
+        assert b.get_ids() == {'1', '2', '3'}
+        assert scans == [os.path.join(handin_dir, 'bar', '1')]
+    finally:
+        handin._scan_submission = scan
+
+    work_dir = os.path.join(my_tmpdir, 'work')
+    os.mkdir(work_dir)
+    data = {}
+    b.prepare('1', data, work_dir)
+    assert 'new.txt' in os.listdir(work_dir)
+    assert data['meta']['submitter_id'] == '1'
+
+def test__manifest_sees_changes_below_the_top(datadir, my_tmpdir):
+    import shutil
+    handin_dir = os.path.join(my_tmpdir, 'handin_dir')
+    shutil.copytree(datadir['handin_dir'], handin_dir)
+    submission = os.path.join(handin_dir, 'bar', '1')
+    os.mkdir(os.path.join(submission, 'sub'))
+    open(os.path.join(submission, 'sub', 'a.cpp'), 'w').close()
+    manifest = os.path.join(my_tmpdir, 'manifest.json')
+    def prepared():
+        b = HandinBackend(submission_name='bar', manifest=manifest)
+        b.setup(handin_directory=handin_dir)
+        b.get_ids()
+        work_dir = tempfile.mkdtemp(dir=my_tmpdir)
+        data = {}
+        b.prepare('1', data, work_dir)
+        return sorted(os.listdir(os.path.join(work_dir, 'sub'))), data['meta']['submission_timestamp']
+    assert prepared()[0] == ['a.cpp']
+
+    # neither of these touches the submission's own directory
+    open(os.path.join(submission, 'sub', 'b.cpp'), 'w').close()
+    with open(os.path.join(submission, 'DateSTAMP'), 'w') as f:
+        f.write('resubmitted')
+    files, timestamp = prepared()
+    assert files == ['a.cpp', 'b.cpp']
+    assert timestamp == datetime.datetime.fromtimestamp(
+        os.stat(os.path.join(submission, 'DateSTAMP')).st_ctime)
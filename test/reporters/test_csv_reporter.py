@@ -16,9 +16,43 @@ def test__basic():
             r.setup(foo_csv_output=f)
             r.on_individual_completion(1, 2, 3, 4)
             r.on_individual_completion(5, 6, 7, 8)
+            r.on_completion(None)
         with open(path) as f:
             assert f.read() == """\
 a,b,c
 1,2,3,4
 5,6,7,8
 """
+
+def test__sort_by_id_from_many_threads():
+    import threading
+    with tempfile.TemporaryDirectory() as d:
+        r = CSVReporter(name='foo', row_fn=fn, sort_by_id=True, batch_size=7, delimiter=',')
+        path = os.path.join(d, 'output.csv')
+        with open(path, 'w') as f:
+            r.setup(foo_csv_output=f)
+            threads = [
+                threading.Thread(target=r.on_individual_completion, args=(i, 'x'*1000, 'y', 'z'))
+                for i in reversed(range(200))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            r.on_completion(None)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        assert rows == [[str(i), 'x'*1000, 'y', 'z'] for i in range(200)]
+
+def test__generator_rows():
+    def rows(id, success, data, global_data):
+        yield (id, 'a')
+        yield (id, 'b')
+    with tempfile.TemporaryDirectory() as d:
+        r = CSVReporter(name='foo', row_fn=rows, fsync=True, delimiter=',')
+        path = os.path.join(d, 'output.csv')
+        with open(path, 'w') as f:
+            r.setup(foo_csv_output=f)
+            r.on_individual_completion(1, True, None, None)
+            r.on_completion(None)
+        with open(path) as f:
+            assert f.read() == '1,a\n1,b\n'
@@ -32,4 +32,117 @@ def test__send_mail(smtp_controller):
         mailout_email_user=None,
         mailout_email_password=None)
     r.on_individual_completion('aaa', True, {'testfile': 'aaa\nbbb\nccc'}, {})
+    r.on_completion({})
     assert [m.get_payload() for m in smtp_controller.messages_recieved] == ['aaa\nbbb\nccc']
+
+def payloads(smtp_controller):
+    return [m.get_payload().replace('\r\n', '\n').rstrip('\n') for m in smtp_controller.messages_recieved]
+
+def make_reporter(smtp_controller, **kwargs):
+    r = SendAsEmailReporter('mailout', 'subject', 'testfile', fn, **kwargs)
+    r.setup(
+        mailout_email_sender='ping@example.com',
+        mailout_email_server=smtp_controller.hostname,
+        mailout_email_port=smtp_controller.port,
+        mailout_email_user=None,
+        mailout_email_password=None)
+    return r
+
+def test__send_mail__reuses_connection(smtp_controller):
+    import smtplib
+    from unittest import mock
+    r = make_reporter(smtp_controller, messages_per_connection=2)
+    with mock.patch('smtplib.SMTP', wraps=smtplib.SMTP) as SMTP:
+        for i in range(5):
+            r.on_individual_completion(str(i), True, {'testfile': str(i)}, {})
+        r.on_completion({})
+    assert payloads(smtp_controller) == ['0', '1', '2', '3', '4']
+    assert SMTP.call_count == 3
+
+def test__send_mail__reconnects(smtp_controller):
+    import time
+    r = make_reporter(smtp_controller)
+    r.on_individual_completion('a', True, {'testfile': 'a'}, {})
+    while not r.delivered:
+        time.sleep(0.01)
+    r._connections[0].smtp.close()
+    r.on_individual_completion('b', True, {'testfile': 'b'}, {})
+    r.on_completion({})
+    assert payloads(smtp_controller) == ['a', 'b']
+
+def test__send_mail__rate_limit(smtp_controller):
+    import time
+    r = make_reporter(smtp_controller, rate_limit=20)
+    start = time.monotonic()
+    for i in range(5):
+        r.on_individual_completion(str(i), True, {'testfile': str(i)}, {})
+    r.on_completion({})
+    assert time.monotonic() - start >= 4/20
+    assert len(payloads(smtp_controller)) == 5
+
+def test__send_mail__spool(smtp_controller, capsys):
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as spool:
+        # as if the last run died with 'a' rendered but unsent, after sending 'b'
+        os.makedirs(os.path.join(spool, 'pending'))
+        os.makedirs(os.path.join(spool, 'sent'))
+        with open(os.path.join(spool, 'pending', 'a'), 'w') as f:
+            f.write('{"id": "a", "destinations": ["foo@example.com"], "message": "Subject: s\\n\\nleftover"}')
+        open(os.path.join(spool, 'sent', 'b'), 'w').close()
+
+        r = SendAsEmailReporter('mailout', 'subject', 'testfile', fn)
+        r.setup(
+            mailout_email_sender='ping@example.com',
+            mailout_email_server=smtp_controller.hostname,
+            mailout_email_port=smtp_controller.port,
+            mailout_email_user=None,
+            mailout_email_password=None,
+            mailout_email_spool=spool)
+        r.on_individual_completion('b', True, {'testfile': 'b'}, {})
+        r.on_individual_completion('c', True, {'testfile': 'c'}, {})
+        r.on_completion({})
+
+        assert sorted(payloads(smtp_controller)) == ['c', 'leftover']
+        assert os.listdir(os.path.join(spool, 'pending')) == []
+        assert sorted(os.listdir(os.path.join(spool, 'sent'))) == ['a', 'b', 'c']
+        assert sorted(r.delivered) == ['a', 'c']
+        assert r.already_sent == ['b']
+        out = capsys.readouterr().out
+        assert 'E-mail mailout: 2 sent, 0 failed' in out
+        assert 'E-mail mailout: 1 not sent again, as {} says they were sent before: b'.format(os.path.join(spool, 'sent')) in out
+
+def test__send_mail__failures_reported(smtp_controller, capsys):
+    r = make_reporter(smtp_controller)
+    r.email_port = 1
+    r.on_individual_completion('a', True, {'testfile': 'a'}, {})
+    r.on_completion({})
+    assert [id for id, _ in r.failed] == ['a']
+    assert 'E-mail mailout: 0 sent, 1 failed' in capsys.readouterr().out
+
+def test__send_mail__spool_pending_replayed(smtp_controller):
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as spool:
+        # the last run rendered 'a' but died before sending it; --run-from
+        # then replays 'a' as well
+        os.makedirs(os.path.join(spool, 'pending'))
+        with open(os.path.join(spool, 'pending', 'a'), 'w') as f:
+            f.write('{"id": "a", "destinations": ["foo@example.com"], "message": "Subject: s\\n\\nleftover"}')
+
+        r = SendAsEmailReporter('mailout', 'subject', 'testfile', fn, queue_size=1)
+        r.setup(
+            mailout_email_sender='ping@example.com',
+            mailout_email_server=smtp_controller.hostname,
+            mailout_email_port=smtp_controller.port,
+            mailout_email_user=None,
+            mailout_email_password=None,
+            mailout_email_spool=spool)
+        r.on_individual_completion('a', True, {'testfile': 'a'}, {})
+        for id in ('b', 'c', 'd'):
+            r.on_individual_completion(id, True, {'testfile': id}, {})
+        r.on_completion({})
+
+        assert sorted(payloads(smtp_controller)) == ['b', 'c', 'd', 'leftover']
+        assert r.failed == []
+        assert sorted(os.listdir(os.path.join(spool, 'sent'))) == ['a', 'b', 'c', 'd']
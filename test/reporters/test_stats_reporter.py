@@ -29,3 +29,54 @@ def test__report_stats():
     assert op2.accumulate.call_args_list == [
         mock.call([op2.read.return_value, op2.read.return_value]),
     ]
+
+def grade(data, global_data):
+    return data['grade']
+
+def test__streaming_operations(capsys):
+    S = stats.StatsReporter
+    r = S([
+        S.Count('count', grade),
+        S.Mean('mean', grade),
+        S.MinMax('minmax', grade),
+        S.Histogram('hist', grade, 0, 100, bins=4),
+        S.Quantiles('quantiles', grade, quantiles=(0.5,)),
+    ])
+    for g in [10, 20, 30, 40, 100, 150]:
+        r.on_individual_completion(str(g), True, {'grade': g}, {})
+    r.on_individual_completion('x', False, {}, {})
+
+    results = {op.name: op.accumulate(r.accumulators[op.name]) for op in r.operations}
+    assert results['count'] == 6
+    assert results['mean']['mean'] == pytest.approx(58.333333)
+    assert results['mean']['variance'] == pytest.approx(3016.666667)
+    assert results['minmax'] == {'min': 10, 'max': 150}
+    assert results['hist'] == {
+        'bins': [(0, 25, 2), (25, 50, 2), (50, 75, 0), (75, 100, 1)],
+        'under': 0,
+        'over': 1,
+    }
+    assert results['quantiles'] == {0.5: 35}
+    r.on_completion(None)
+    assert 'Statistics (of 6 successful items):' in capsys.readouterr().out
+
+def test__merge():
+    import random
+    S = stats.StatsReporter
+    def make():
+        return S([S.Mean('mean', grade), S.Quantiles('q', grade, quantiles=(0.1, 0.5, 0.9))])
+    whole, left, right = make(), make(), make()
+    values = [random.Random(i).gauss(0, 1) for i in range(20000)]
+    for i, v in enumerate(values):
+        whole.on_individual_completion(i, True, {'grade': v}, {})
+        (left if i % 2 else right).on_individual_completion(i, True, {'grade': v}, {})
+    left.merge(right)
+    assert left.item_count == whole.item_count == 20000
+    merged = left.accumulators['mean'].result()
+    expected = whole.accumulators['mean'].result()
+    assert merged['mean'] == pytest.approx(expected['mean'])
+    assert merged['variance'] == pytest.approx(expected['variance'])
+    exact = sorted(values)
+    for q in (0.1, 0.5, 0.9):
+        assert left.accumulators['q'].quantile(q) == pytest.approx(exact[int(q*len(exact))], abs=0.02)
+    assert len(left.accumulators['q'].centroids) < 500
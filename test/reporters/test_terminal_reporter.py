@@ -0,0 +1,78 @@
+from autograder.reporters import TerminalReporter
+
+import autograder
+import os.path
+import tempfile
+from unittest import mock
+import pytest
+
+def test__live_status():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'log.txt')
+        r = TerminalReporter(live=True, log=log, refresh=60)
+        r.on_start(['a', 'b', 'c', 'd'])
+        r.on_individual_start('a')
+        r.on_individual_start('b')
+        r.on_action_start('a', 'make_all')
+        r.on_part_completion('make_all', {'success': True, 'operation': 'make all', 'output': 'built'})
+        r.on_individual_end('a', True)
+        r.on_individual_completion('a', True, {}, {})
+        r.on_action_start('b', 'valgrind_test')
+
+        lines = r.status_lines()
+        assert lines[0] == 'done 1/4  in flight 1  queued 2  failed 0'
+        assert lines[2].endswith('b  valgrind_test')
+
+        r.on_individual_end('b', False)
+        r.on_individual_completion('b', False, {'x': {'success': False, 'operation': 'op', 'output': 'bad'}}, {})
+        assert r.status_lines()[0] == 'done 2/4  in flight 0  queued 2  failed 1'
+        r.on_completion({})
+        with open(log) as f:
+            contents = f.read()
+        assert 'make_all: make all\nbuilt\n' in contents
+        assert 'Finished b: failure' in contents
+
+def test__session_reports_progress():
+    reporter = mock.create_autospec(autograder.Reporter)
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'a'}
+    action = mock.create_autospec(autograder.Action)
+    action.name = 'act'
+    def side_effect(data, work_dir):
+        data['act'] = {'success': True}
+        return True
+    action.perform.side_effect = side_effect
+
+    autograder.Session([backend], [reporter], [action]).run()
+
+    assert reporter.on_start.call_args_list == [mock.call(['a'])]
+    assert reporter.on_individual_start.call_args_list == [mock.call('a')]
+    assert reporter.on_action_start.call_args_list == [mock.call('a', 'act')]
+
+@pytest.mark.parametrize('executor', ['thread', 'process', 'asyncio'])
+def test__live_status_with_batch(executor):
+    import asyncio
+    from autograder.batch import BatchGrade
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {str(i) for i in range(6)}
+    action = mock.create_autospec(autograder.Action)
+    def side_effect(data, work_dir):
+        data['act'] = {'success': True, 'operation': 'act'}
+        return True
+    action.perform.side_effect = side_effect
+    with tempfile.TemporaryDirectory() as d:
+        r = TerminalReporter(live=True, log=os.path.join(d, 'log.txt'), refresh=60)
+        seen = []
+        def grade(table):
+            # every submission is graded, but none reported yet
+            seen.append(r.status_lines()[0])
+            return [1]*len(table['x'])
+        session = autograder.Session(
+            [backend], [r], [action], max_workers=3,
+            executor='thread' if executor == 'asyncio' else executor,
+            batch=[BatchGrade('b', {'x': lambda data: 1}, grade)])
+        if executor == 'asyncio':
+            asyncio.run(session.run_async())
+        else:
+            session.run()
+    assert seen == ['done 6/6  in flight 0  queued 0  failed 0']
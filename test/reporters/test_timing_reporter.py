@@ -0,0 +1,21 @@
+from autograder.reporters import TimingReporter
+
+def test__summary(capsys):
+    r = TimingReporter()
+    for i in range(1, 101):
+        r.on_individual_completion(str(i), True, {
+            'timing': {'prepare': 1, 'total': i + 1},
+            'make_all': {'success': True, 'timing': {'wall': i, 'queued': 0, 'cpu_user': 1, 'cpu_system': 2, 'max_rss': 10*i}},
+            'read_x': {'success': True},
+            'x': 'contents',
+        }, {})
+    summary = r.summary()
+    assert set(summary) == {'prepare', 'total', 'make_all'}
+    assert summary['make_all']['wall'] == {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100, 'total': 5050, 'count': 100}
+    assert summary['make_all']['cpu']['max'] == 3
+    assert summary['make_all']['max_rss']['p50'] == 500
+    assert summary['prepare']['wall']['total'] == 100
+
+    r.on_completion({})
+    out = capsys.readouterr().out
+    assert out.index('total:') < out.index('make_all:') < out.index('prepare:')
@@ -0,0 +1,105 @@
+import autograder
+from autograder import actions
+
+import asyncio
+import collections
+import threading
+import pytest
+from unittest import mock
+
+class _Step(autograder.Action):
+    def __init__(self, name, success=True, barrier=None, error=None):
+        self.name = name
+        self.success = success
+        self.barrier = barrier
+        self.error = error
+    def perform(self, data, work_dir):
+        if self.barrier is not None:
+            # only gets past here if the other branch is running too
+            self.barrier.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        data[self.name] = {'success': self.success}
+        return self.success
+
+def test__action_graph_runs_branches_together():
+    barrier = threading.Barrier(2)
+    graph = autograder.ActionGraph([
+        ('a', _Step('a', barrier=barrier), []),
+        ('b', _Step('b', barrier=barrier), []),
+        ('c', _Step('c'), ['a', 'b']),
+    ])
+    data = collections.OrderedDict()
+
+    assert graph.perform(data, None)
+    assert list(data)[-1] == 'c'
+    assert set(data) == {'a', 'b', 'c'}
+    assert not barrier.broken
+
+def test__action_graph_failure_skips_dependents_only():
+    graph = autograder.ActionGraph([
+        ('a', _Step('a', success=False), []),
+        ('b', _Step('b'), []),
+        ('c', _Step('c'), ['a']),
+        ('d', _Step('d'), ['c']),
+        ('e', _Step('e'), ['b']),
+    ])
+    data = collections.OrderedDict()
+
+    assert not graph.perform(data, None)
+    assert set(data) == {'a', 'b', 'e'}
+
+def test__action_graph_exception():
+    graph = autograder.ActionGraph([
+        ('a', _Step('a', error=KeyError('x')), []),
+        ('b', _Step('b'), ['a']),
+    ])
+    with pytest.raises(KeyError):
+        graph.perform(collections.OrderedDict(), None)
+
+def test__action_graph_merges_grades():
+    graph = autograder.ActionGraph([
+        ('one', actions.CalculateGrade('one', lambda data: 1), []),
+        ('two', actions.CalculateGrade('two', lambda data: 2), []),
+    ])
+    data = collections.OrderedDict()
+    assert graph.perform(data, None)
+    assert data['grades'] == {'one': 1, 'two': 2}
+
+@pytest.mark.parametrize('steps', [
+    [('a', None, ['b'])],
+    [('a', None, []), ('a', None, [])],
+    [('a', None, ['b']), ('b', None, ['a'])],
+])
+def test__action_graph_bad_steps(steps):
+    with pytest.raises(ValueError):
+        autograder.ActionGraph(steps)
+
+def test__action_graph_in_session():
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1'}
+    reporter = mock.create_autospec(autograder.Reporter)
+    barrier = threading.Barrier(2)
+    graph = autograder.ActionGraph([
+        ('a', _Step('a', barrier=barrier), []),
+        ('b', _Step('b', barrier=barrier), []),
+    ])
+
+    data = autograder.Session([backend], [reporter], [graph, _Step('after')]).run()
+
+    assert data['submissions']['id1']['success']
+    parts = [c[0][0] for c in reporter.on_part_completion.call_args_list]
+    assert sorted(parts[:2]) == ['a', 'b'] and parts[2] == 'after'
+    started = [c[0][1] for c in reporter.on_action_start.call_args_list]
+    assert sorted(started[:2]) == ['a', 'b']
+
+def test__action_graph_async():
+    graph = autograder.ActionGraph([
+        ('a', _Step('a'), []),
+        ('b', _Step('b', success=False), []),
+        ('c', _Step('c'), ['a']),
+        ('d', _Step('d'), ['b']),
+    ])
+    data = collections.OrderedDict()
+    assert not asyncio.run(graph.perform_async(data, None))
+    assert set(data) == {'a', 'b', 'c'}
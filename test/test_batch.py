@@ -0,0 +1,99 @@
+import autograder
+from autograder import batch
+from autograder.batch import BatchGrade
+
+from unittest import mock
+import math
+import pytest
+
+def curve(table):
+    top = max(table['raw'])
+    return [100*x/top for x in table['raw']]
+
+@pytest.fixture
+def backend():
+    b = mock.create_autospec(autograder.Backend)
+    b.get_ids.return_value = {'a', 'b', 'c', 'd'}
+    return b
+
+@pytest.fixture
+def action():
+    a = mock.create_autospec(autograder.Action)
+    scores = {'a': 10, 'b': 20, 'c': 40, 'd': None}
+    def side_effect(data, work_dir):
+        id = data['id']
+        if scores[id] is None:
+            data['raw'] = {'success': False}
+            return False
+        data.setdefault('grades', {})['raw'] = scores[id]
+        data['raw'] = {'success': True}
+        return True
+    a.perform.side_effect = side_effect
+    return a
+
+@pytest.fixture
+def id_backend(backend):
+    def prepare(id, data, work_dir):
+        data['id'] = id
+    backend.prepare.side_effect = prepare
+    return backend
+
+def test__column():
+    c = batch.column([1, None, '2.5'])
+    assert list(c)[0] == 1.0 and math.isnan(list(c)[1]) and list(c)[2] == 2.5
+
+def test__session_batch_grade(id_backend, action):
+    reporter = mock.create_autospec(autograder.Reporter)
+    seen = {}
+    def on_individual_completion(id, success, data, global_data):
+        seen[id] = dict(data.get('grades', {}))
+    reporter.on_individual_completion.side_effect = on_individual_completion
+    session = autograder.Session([id_backend], [reporter], [action], batch=[
+        BatchGrade('curved', {'raw': lambda data: data['grades']['raw']}, curve),
+    ])
+
+    submissions = session.run()['submissions']
+
+    assert submissions['a']['grades'] == {'raw': 10, 'curved': 25}
+    assert submissions['c']['grades'] == {'raw': 40, 'curved': 100}
+    assert submissions['a']['batch_grade_curved']['success']
+    assert 'curved' not in submissions['d'].get('grades', {})
+    # reporters only hear about submissions once batch grades are in
+    assert seen == {'a': {'raw': 10, 'curved': 25}, 'b': {'raw': 20, 'curved': 50}, 'c': {'raw': 40, 'curved': 100}, 'd': {}}
+
+def test__session_batch_grade_resume(id_backend, action, tmp_path):
+    from autograder import results
+    path = str(tmp_path / 'checkpoint.jsonl')
+    w = results.JSONLWriter(path)
+    w.write('c', {'success': True, 'grades': {'raw': 40}})
+    w.close()
+    reporter = mock.create_autospec(autograder.Reporter)
+    session = autograder.Session([id_backend], [reporter], [action], batch=[
+        BatchGrade('curved', {'raw': lambda data: data['grades']['raw']}, curve),
+    ])
+
+    submissions = session.run(writer=results.JSONLWriter(path, resume=True))['submissions']
+
+    # the earlier grade still counts towards the curve, but isn't reported again
+    assert submissions['a']['grades'] == {'raw': 10, 'curved': 25}
+    assert submissions['c']['grades'] == {'raw': 40, 'curved': 100}
+    reported = {c[0][0] for c in reporter.on_individual_completion.call_args_list}
+    assert reported == {'a', 'b', 'd'}
+
+def test__session_batch_grade_failure(id_backend, action):
+    def broken(table):
+        return [1]
+    session = autograder.Session([id_backend], [], [action], batch=[
+        BatchGrade('broken', {'raw': lambda data: data['grades']['raw']}, broken),
+    ])
+
+    submissions = session.run()['submissions']
+
+    assert not submissions['a']['success']
+    assert 'returned 1 grades for 3 submissions' in submissions['a']['batch_grade_broken']['output']
+
+def test__numpy_columns():
+    numpy = pytest.importorskip('numpy')
+    b = BatchGrade('z', {'x': lambda data: data['x']}, lambda t: (t['x'] - t['x'].mean())/t['x'].std())
+    grades = b.grade(['a', 'b'], [{'x': 1}, {'x': 3}])
+    assert grades == {'a': -1.0, 'b': 1.0}
@@ -0,0 +1,140 @@
+import autograder
+from autograder.cache import ResultCache
+
+from unittest import mock
+import hashlib
+import json
+import os
+import tempfile
+import pytest
+
+@pytest.fixture
+def cache():
+    with tempfile.TemporaryDirectory() as d:
+        yield ResultCache(os.path.join(d, 'cache'), salt='gradefile')
+
+@pytest.fixture
+def backend():
+    b = mock.create_autospec(autograder.Backend)
+    b.get_ids.return_value = {'id1'}
+    def fingerprint(id, hasher):
+        hasher.update(b'contents')
+    b.fingerprint.side_effect = fingerprint
+    return b
+
+def test__cache_roundtrip(cache, backend):
+    key = cache.key('id1', [backend])
+    assert cache.get(key) is None
+    assert cache.put(key, {'success': True, 'a': {'success': True}})
+    assert cache.get(key) == {'success': True, 'a': {'success': True}}
+
+def test__cache_key_depends_on_inputs(cache, backend):
+    key = cache.key('id1', [backend])
+    assert key != cache.key('id2', [backend])
+    assert key != ResultCache(cache.directory, salt='other').key('id1', [backend])
+    backend.fingerprint.side_effect = lambda id, hasher: hasher.update(b'changed')
+    assert key != cache.key('id1', [backend])
+
+def test__cache_skips_tracebacks(cache, backend):
+    key = cache.key('id1', [backend])
+    assert not cache.put(key, {'success': False, 'traceback': '...'})
+    assert cache.get(key) is None
+
+def test__session_run_cached(cache, backend):
+    reporter = mock.create_autospec(autograder.Reporter)
+    action = mock.create_autospec(autograder.Action)
+    def side_effect(data, work_dir):
+        data['action'] = {'success': True}
+        return True
+    action.perform.side_effect = side_effect
+
+    first = autograder.Session([backend], [reporter], [action], cache=cache).run()
+    second = autograder.Session([backend], [reporter], [action], cache=cache).run()
+
+    assert first['submissions'] == second['submissions']
+    assert action.perform.call_count == 1
+    assert reporter.on_individual_completion.call_count == 2
+    assert reporter.on_part_completion.call_args_list == [
+        mock.call('action', {'success': True, 'timing': mock.ANY}),
+    ]*2
+
+def test__session_cache_sees_copied_files(cache, backend, tmp_path, monkeypatch):
+    from autograder.actions import CopyFile
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'tests.txt').write_text('one')
+    action = mock.create_autospec(autograder.Action)
+    action.perform.side_effect = lambda data, work_dir: True
+
+    autograder.Session([backend], [], [CopyFile('tests.txt'), action], cache=cache).run()
+    autograder.Session([backend], [], [CopyFile('tests.txt'), action], cache=cache).run()
+    assert action.perform.call_count == 1
+    (tmp_path / 'tests.txt').write_text('two')
+    autograder.Session([backend], [], [CopyFile('tests.txt'), action], cache=cache).run()
+    assert action.perform.call_count == 2
+
+def test__session_cache_warns_without_fingerprint(cache):
+    class Plain(autograder.Backend):
+        pass
+    with pytest.warns(UserWarning, match='Plain does not override fingerprint'):
+        autograder.Session([Plain()], [], [], cache=cache)
+
+def test__cache_salt_covers_local_modules(tmp_path, monkeypatch):
+    import importlib
+    import sys
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'modules', dict(sys.modules))
+    (tmp_path / 'grading_helpers.py').write_text('X = 1\n')
+    importlib.import_module('grading_helpers')
+    def salt(definitions={}):
+        return autograder._cache_salt('source', definitions, {'grading_helpers', 'json'}, [str(tmp_path)])
+
+    first = salt()
+    assert first != salt({'cache_salt': 'v2'})
+    (tmp_path / 'grading_helpers.py').write_text('X = 2\n')
+    assert first != salt()
+
+GRADEFILE = '''
+import autograder
+class Backend(autograder.Backend):
+    requirements = {}
+    def get_ids(self):
+        return {'a'}
+    def fingerprint(self, id, hasher):
+        hasher.update(b'a')
+class Count(autograder.Action):
+    def perform(self, data, work_dir):
+        with open(%r, 'a') as f:
+            f.write('x')
+        data['count'] = {'success': True, 'operation': 'count'}
+        return True
+backends = [Backend()]
+reporters = []
+actions = [Count()]
+'''
+
+def main(monkeypatch, tmp_path, *flags):
+    import sys
+    gradefile = tmp_path / 'gradefile.py'
+    gradefile.write_text(GRADEFILE % str(tmp_path / 'count'))
+    argv = ['autograder', str(gradefile), '--only-terminal', '--no-live',
+            '--output', str(tmp_path / 'out.json')] + list(flags)
+    monkeypatch.setattr(sys, 'argv', argv)
+    autograder.main()
+
+def test__main_cache(tmp_path, monkeypatch, capsys):
+    main(monkeypatch, tmp_path, '--cache', str(tmp_path / 'cache'))
+    main(monkeypatch, tmp_path, '--cache', str(tmp_path / 'cache'))
+    assert (tmp_path / 'count').read_text() == 'x'
+    assert json.loads((tmp_path / 'out.json').read_text())['submissions']['a']['success']
+
+@pytest.mark.parametrize('flags', [
+    ['--executor', 'process'],
+    ['--engine', 'asyncio'],
+    ['--checkpoint', 'checkpoint.jsonl'],
+    ['--resume', 'checkpoint.jsonl'],
+    ['--max-workers', '1', '--cpus', '1'],
+])
+def test__main_flags(tmp_path, monkeypatch, capsys, flags):
+    monkeypatch.chdir(tmp_path)
+    main(monkeypatch, tmp_path, *flags)
+    assert json.loads((tmp_path / 'out.json').read_text())['submissions']['a']['success']
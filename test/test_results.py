@@ -0,0 +1,211 @@
+from autograder import results
+
+import autograder
+import collections
+import datetime
+import io
+import json
+import os.path
+import tempfile
+import pytest
+from unittest import mock
+
+@pytest.fixture
+def path():
+    with tempfile.TemporaryDirectory() as d:
+        yield os.path.join(d, 'results.jsonl')
+
+@pytest.mark.parametrize('document', [
+    {},
+    {'submissions': {}},
+    {'a': [1, {'b': 2}], 'submissions': {
+        'x': collections.OrderedDict([('meta', {'t': datetime.datetime(2017, 3, 22)}), ('success', True)]),
+        'y': {'success': False, 'traceback': 'line\nline'},
+    }},
+])
+def test__dump_matches_json(document):
+    expected = io.StringIO()
+    json.dump(document, expected, indent=2, default=repr)
+    actual = io.StringIO()
+    results.dump(document, actual)
+    assert actual.getvalue() == expected.getvalue()
+
+def test__jsonl_writer(path):
+    w = results.JSONLWriter(path)
+    w.write('x', {'success': True})
+    w.write('y', {'success': False, 'when': datetime.date(2017, 3, 22)})
+    with open(path) as f:
+        assert [json.loads(line)['id'] for line in f] == ['x', 'y']
+    submissions = w.submissions()
+    assert dict(submissions.items()) == {
+        'x': {'success': True},
+        'y': {'success': False, 'when': repr(datetime.date(2017, 3, 22))},
+    }
+    assert submissions['x'] == {'success': True}
+    assert len(submissions) == 2
+    w.close()
+
+def test__session_run_with_writer(path):
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    reporter = mock.create_autospec(autograder.Reporter)
+    w = results.JSONLWriter(path)
+
+    data = autograder.Session([backend], [reporter], []).run(writer=w)
+
+    assert dict(data['submissions'].items()) == {
+        'id1': {'success': True, 'timing': mock.ANY},
+        'id2': {'success': True, 'timing': mock.ANY},
+    }
+    with open(path) as f:
+        assert sorted(json.loads(line)['id'] for line in f) == ['id1', 'id2']
+
+def test__jsonl_writer_resume(path):
+    w = results.JSONLWriter(path)
+    w.write('x', {'success': True})
+    w.close()
+    with open(path, 'a') as f:
+        f.write('{"id": "y", "da')
+
+    w = results.JSONLWriter(path, resume=True)
+    assert set(w.offsets) == {'x'}
+    w.write('z', {'success': False})
+    assert dict(w.submissions().items()) == {'x': {'success': True}, 'z': {'success': False}}
+    w.close()
+
+    assert results.JSONLWriter(path).offsets == {}
+
+def test__session_run_resume(path):
+    w = results.JSONLWriter(path)
+    w.write('id1', {'success': True, 'from': 'before'})
+    w.close()
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    reporter = mock.create_autospec(autograder.Reporter)
+
+    data = autograder.Session([backend], [reporter], []).run(writer=results.JSONLWriter(path, resume=True))
+
+    assert dict(data['submissions'].items()) == {
+        'id1': {'success': True, 'from': 'before'},
+        'id2': {'success': True, 'timing': mock.ANY},
+    }
+    assert backend.prepare.call_args_list == [mock.call('id2', mock.ANY, mock.ANY)]
+    assert reporter.on_completion.call_args_list == [mock.call(data)]
+
+STREAMED = {'course': 'c', 'submissions': {
+    'x': {'success': True, 'grade': 12.5, 'output': 'café ☃\n{"not": "a key"}'},
+    'yé': {'success': False, 'nested': {'submissions': [1, 2, 3]}},
+    'z': {'success': True, 'grade': 1e100},
+}, 'after': [None, True]}
+
+@pytest.mark.parametrize('chunk', [1, 3, 1 << 16])
+def test__load_matches_json(path, chunk):
+    # written by hand so the file holds multi-byte UTF-8, unlike dump's output
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(STREAMED, f, indent=2, ensure_ascii=False)
+    with mock.patch.object(results._Reader, '_chunk', chunk):
+        with open(path) as f:
+            loaded = results.load(f)
+        assert loaded.keys() == STREAMED.keys()
+        assert loaded['course'] == 'c' and loaded['after'] == [None, True]
+        assert dict(loaded['submissions'].items()) == STREAMED['submissions']
+        assert loaded['submissions']['yé'] == STREAMED['submissions']['yé']
+
+def test__dump_index(path):
+    with open(path, 'w') as f:
+        index = results.dump(STREAMED, f)
+    results.save_index(path, index)
+    with open(path, 'rb') as f:
+        assert results.build_index(f) == index
+    assert results.load_index(path) == dict(index, stamp=mock.ANY)
+
+    # a stale index is rebuilt rather than trusted
+    with open(path, 'w') as f:
+        json.dump({'submissions': {'w': {'success': True}}}, f)
+    assert results.load_index(path) is None
+    with open(path) as f:
+        assert dict(results.load(f)['submissions'].items()) == {'w': {'success': True}}
+
+def test__load_not_a_file():
+    assert results.load(io.StringIO(json.dumps(STREAMED))) == STREAMED
+
+def test__run_from_results_only_ids(path):
+    with open(path, 'w') as f:
+        results.dump(STREAMED, f)
+    with open(path) as f:
+        loaded = results.load(f)
+    reporter = mock.create_autospec(autograder.Reporter)
+
+    with mock.patch.object(results, '_value_at', wraps=results._value_at) as value_at:
+        autograder.Session([], [reporter], []).run_from_results(loaded, only_ids=['z'])
+
+    assert value_at.call_count == 1
+    assert reporter.on_individual_completion.call_args_list == [
+        mock.call('z', True, STREAMED['submissions']['z'], loaded)]
+
+@pytest.mark.parametrize('codec', ['gzip', 'lzma'])
+def test__compact_round_trip(path, codec):
+    with open(path, 'wb') as f:
+        results.dump_compact(STREAMED, f, codec=codec)
+    with open(path) as f:
+        loaded = results.load(f)
+    assert list(loaded) == list(STREAMED)
+    assert loaded['after'] == [None, True]
+    assert list(loaded['submissions']) == list(STREAMED['submissions'])
+    assert loaded['submissions']['yé'] == STREAMED['submissions']['yé']
+    assert dict(loaded['submissions'].items()) == STREAMED['submissions']
+
+def test__compact_truncated(path):
+    with open(path, 'wb') as f:
+        results.dump_compact(STREAMED, f)
+    with open(path, 'rb+') as f:
+        f.truncate(os.path.getsize(path)-1)
+    with pytest.raises(ValueError):
+        results.load_compact(path)
+
+def test__convert(path):
+    source = path+'.json'
+    with open(source, 'w') as f:
+        json.dump(STREAMED, f, indent=2, default=repr)
+    results.convert(source, path)
+    with open(path, 'rb') as f:
+        assert results.is_compact(f)
+    # no index left beside the source
+    assert not os.path.exists(source+'.idx')
+    results.convert(path, source+'.again')
+    with open(source) as expected, open(source+'.again') as actual:
+        assert actual.read() == expected.read()
+
+def test__convert_command(path):
+    import subprocess
+    import sys
+    source = path+'.json'
+    with open(source, 'w') as f:
+        json.dump(STREAMED, f)
+    proc = subprocess.run(
+        [sys.executable, '-m', 'autograder.convert', source, path, '--codec', 'lzma'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert proc.returncode == 0 and proc.stdout == ''
+    with open(path) as f:
+        assert dict(results.load(f)['submissions'].items()) == STREAMED['submissions']
+
+@pytest.mark.parametrize('kind', ['JSONLSubmissions', 'StreamedSubmissions', 'CompactSubmissions'])
+def test__membership_reads_nothing(path, kind):
+    if kind == 'JSONLSubmissions':
+        w = results.JSONLWriter(path)
+        for id, data in STREAMED['submissions'].items():
+            w.write(id, data)
+        submissions = w.submissions()
+    else:
+        with open(path, 'w' if kind == 'StreamedSubmissions' else 'wb') as f:
+            if kind == 'StreamedSubmissions':
+                json.dump(STREAMED, f)
+            else:
+                results.dump_compact(STREAMED, f)
+        with open(path) as f:
+            submissions = results.load(f)['submissions']
+    assert type(submissions).__name__ == kind
+    with mock.patch.object(type(submissions), '__getitem__') as getitem:
+        assert 'yé' in submissions and 'nope' not in submissions
+    getitem.assert_not_called()
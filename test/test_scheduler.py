@@ -0,0 +1,121 @@
+from autograder import scheduler
+
+import autograder
+import threading
+import time
+import pytest
+from unittest import mock
+
+def test__pool_defaults():
+    pool = scheduler.ResourcePool(cpus=3, memory=100)
+    assert pool.capacity == {'cpu': 3, 'memory': 100}
+    assert pool.available == pool.capacity
+
+def test__pool_acquire_release():
+    pool = scheduler.ResourcePool(cpus=2, memory=100)
+    held = pool.acquire({'cpu': 1, 'memory': 60})
+    assert pool.available == {'cpu': 1, 'memory': 40}
+    pool.release(held)
+    assert pool.available == {'cpu': 2, 'memory': 100}
+
+def test__pool_clamps_oversized_cost():
+    pool = scheduler.ResourcePool(cpus=1, memory=100)
+    with pool.reserve({'cpu': 4, 'memory': 1000, 'gpu': 1}):
+        assert pool.available == {'cpu': 0, 'memory': 0}
+    assert pool.available == {'cpu': 1, 'memory': 100}
+
+class _Busy(autograder.Action):
+    cost = {'cpu': 1}
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+    def perform(self, data, work_dir):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return True
+
+def test__session_throttles_costly_actions():
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {str(i) for i in range(8)}
+    action = _Busy()
+    session = autograder.Session([backend], [], [action], resources=scheduler.ResourcePool(cpus=2), max_workers=8)
+
+    session.run()
+
+    assert action.peak == 2
+
+def test__perform_without_pool():
+    action = _Busy()
+    assert scheduler.perform(action, {}, None)
+    assert action.peak == 1
+
+def test__pool_acquire_async_waits_for_release():
+    import asyncio
+    pool = scheduler.ResourcePool(cpus=1)
+    async def go():
+        held = await pool.acquire_async({'cpu': 1})
+        waiting = asyncio.ensure_future(pool.acquire_async({'cpu': 1}))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        # released from another thread, as offloaded actions do
+        t = threading.Thread(target=pool.release, args=(held,))
+        t.start()
+        t.join()
+        pool.release(await waiting)
+    asyncio.run(go())
+    assert pool.available == {'cpu': 1, 'memory': pool.capacity['memory']}
+
+def test__jobserver_tokens():
+    pool = scheduler.ResourcePool(cpus=2, memory=100, jobserver=True)
+    try:
+        held = pool.acquire({'cpu': 2, 'memory': 10})
+        assert held == {'cpu': 2, 'memory': 10}
+        assert pool.available['memory'] == 90
+        pool.release(held)
+        # both tokens are back in the pipe
+        assert pool.jobserver.acquire(2) == 2
+        pool.jobserver.release(2)
+    finally:
+        pool.jobserver.close()
+
+def test__jobserver_acquire_async():
+    import asyncio
+    pool = scheduler.ResourcePool(cpus=1, jobserver=True)
+    async def main():
+        held = await pool.acquire_async({'cpu': 1})
+        waiting = asyncio.ensure_future(pool.acquire_async({'cpu': 1}))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        pool.release(held)
+        pool.release(await asyncio.wait_for(waiting, 5))
+    try:
+        asyncio.run(main())
+    finally:
+        pool.jobserver.close()
+
+class _Sleep(autograder.Action):
+    def __init__(self, cost):
+        self.cost = cost
+    def perform(self, data, work_dir):
+        time.sleep(0.3)
+        data['sleep'] = {'success': True}
+        return True
+
+@pytest.mark.parametrize('pool,cost', [
+    (lambda: scheduler.ResourcePool(cpus=1), {'cpu': 1}),
+    (lambda: scheduler.ResourcePool(cpus=4, memory=100), {'memory': 100}),
+])
+def test__pool_shared_by_process_workers(pool, cost):
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {str(i) for i in range(4)}
+    session = autograder.Session([backend], [], [_Sleep(cost)], executor='process', resources=pool(), max_workers=4)
+    start = time.monotonic()
+    submissions = session.run()['submissions']
+    # one at a time, across all four workers
+    assert time.monotonic() - start >= 1.2
+    assert all(data['success'] for data in submissions.values())
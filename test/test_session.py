@@ -125,3 +125,158 @@ def test__session_run__only_ids__except_ids(run_individual, TemporaryDirectory,
         mock.call(mock.ANY, work_dir),
     ]
     assert reporter.on_completion.called
+
+class _PidAction(autograder.Action):
+    def perform(self, data, work_dir):
+        import os
+        data['pid'] = {'success': True, 'pid': os.getpid(), 'unpicklable': lambda: None}
+        return True
+
+def test__session_run__process_executor(reporter):
+    import os
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    session = autograder.Session([backend], [reporter], [_PidAction()], executor='process')
+
+    submissions = session.run()['submissions']
+
+    assert set(submissions) == {'id1', 'id2'}
+    for data in submissions.values():
+        assert data['success']
+        assert data['pid']['pid'] != os.getpid()
+        assert isinstance(data['pid']['unpicklable'], str)
+    assert sorted(c[0][0] for c in reporter.on_individual_completion.call_args_list) == ['id1', 'id2']
+    assert [c[0][0] for c in reporter.on_part_completion.call_args_list] == ['pid', 'pid']
+
+class _SlowAction(autograder.Action):
+    def perform(self, data, work_dir):
+        import time
+        time.sleep(0.2)
+        data['slow'] = {'success': True}
+        return True
+
+def test__session_run__process_executor_progress(reporter):
+    import os
+    import threading
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    seen = []
+    def record(name):
+        return lambda *args: seen.append((name, os.getpid(), threading.current_thread() is not threading.main_thread()) + args)
+    reporter.on_individual_start.side_effect = record('start')
+    reporter.on_action_start.side_effect = record('action')
+    session = autograder.Session([backend], [reporter], [_SlowAction()], executor='process')
+
+    session.run()
+
+    # heard here, in the parent, while the workers were still going
+    assert sorted(seen) == [
+        ('action', os.getpid(), True, 'id1', '_SlowAction'),
+        ('action', os.getpid(), True, 'id2', '_SlowAction'),
+        ('start', os.getpid(), True, 'id1'),
+        ('start', os.getpid(), True, 'id2'),
+    ]
+
+def test__session_process_workers_forked_before_reporter_threads():
+    import multiprocessing
+    import os
+    class Threaded(autograder.Reporter):
+        def setup(self, **data):
+            # what a reporter that starts threads in setup would see
+            self.workers = {p.pid for p in multiprocessing.active_children()}
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    reporter = Threaded()
+    session = autograder.Session([backend], [reporter], [_PidAction()], executor='process', max_workers=2)
+
+    submissions = session.run()['submissions']
+
+    assert len(reporter.workers) == 2
+    assert {data['pid']['pid'] for data in submissions.values()} <= reporter.workers
+    assert os.getpid() not in reporter.workers
+
+def test__session___init____bad_executor():
+    with pytest.raises(ValueError):
+        autograder.Session([], [], [], executor='fibers')
+
+def test__session_run_async(reporter):
+    import asyncio
+    import sys
+    from autograder import actions, scheduler
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {str(i) for i in range(4)}
+    session = autograder.Session([backend], [reporter], [
+        actions.Subprocess('run', [sys.executable, '-c', 'print("hi")']),
+        actions.CalculateGrade('g', lambda data: len(data['run']['output'])),
+    ], resources=scheduler.ResourcePool(cpus=2))
+
+    submissions = asyncio.run(session.run_async())['submissions']
+
+    assert set(submissions) == {'0', '1', '2', '3'}
+    for data in submissions.values():
+        assert data['success']
+        assert data['run']['output'] == 'hi\n'
+        assert data['grades'] == {'g': 3}
+        assert data['run']['timing']['wall'] > 0
+    assert reporter.on_individual_completion.call_count == 4
+    assert reporter.on_completion.called
+
+class _BuildHarness(autograder.Action):
+    def perform(self, data, work_dir):
+        import os
+        with open(os.path.join(work_dir, 'harness.txt'), 'w') as f:
+            f.write('built once')
+        data['build_harness'] = {'success': True, 'pid': os.getpid()}
+        return True
+
+class _ReadHarness(autograder.Action):
+    def perform(self, data, work_dir):
+        import os
+        with open(os.path.join(work_dir, 'harness.txt')) as f:
+            data['read_harness'] = {'success': True, 'output': f.read()}
+        return True
+
+@pytest.mark.parametrize('executor', ['thread', 'process', 'asyncio'])
+def test__session_run__global_actions(reporter, executor):
+    import asyncio
+    from autograder import actions
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    session = autograder.Session(
+        [backend], [reporter], [actions.CopyGlobal('harness.txt'), _ReadHarness()],
+        executor='thread' if executor == 'asyncio' else executor,
+        global_actions=[_BuildHarness()])
+
+    if executor == 'asyncio':
+        data = asyncio.run(session.run_async())
+    else:
+        data = session.run()
+
+    assert data['global_actions']['build_harness']['success']
+    for id in ('id1', 'id2'):
+        assert data['submissions'][id]['success']
+        assert data['submissions'][id]['read_harness']['output'] == 'built once'
+
+def test__session_run__global_actions_fail(backend, reporter, action2):
+    session = autograder.Session([backend], [reporter], [], global_actions=[action2])
+    with pytest.raises(RuntimeError):
+        session.run()
+    assert not backend.prepare.called
+
+def test__session_run__global_artifacts_are_private(reporter):
+    import shutil
+    from autograder import actions
+    backend = mock.create_autospec(autograder.Backend)
+    backend.get_ids.return_value = {'id1', 'id2'}
+    # a program writing in place, as compilers and student code do
+    session = autograder.Session(
+        [backend], [reporter],
+        [actions.CopyGlobal('harness.txt'),
+         actions.Subprocess('clobber', [shutil.which('sh'), '-c', 'cat harness.txt; echo corrupted > harness.txt'])],
+        max_workers=1,
+        global_actions=[_BuildHarness()])
+
+    submissions = session.run()['submissions']
+
+    for id in ('id1', 'id2'):
+        assert submissions[id]['clobber']['output'] == 'built once'
@@ -0,0 +1,52 @@
+from autograder import staging
+from autograder.actions import WriteFile
+
+import os
+import os.path
+import tempfile
+import pytest
+
+@pytest.fixture
+def src():
+    with tempfile.TemporaryDirectory() as d:
+        os.makedirs(os.path.join(d, 'sub'))
+        for name in ['data.csv', 'main.cpp', os.path.join('sub', 'more.csv')]:
+            with open(os.path.join(d, name), 'w') as f:
+                f.write(name)
+        yield d
+
+@pytest.fixture
+def dst(src):
+    # next to src, so hard links are possible
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(src)) as d:
+        yield d
+
+def contents(path):
+    with open(path) as f:
+        return f.read()
+
+def test__stage_tree_copy(src, dst):
+    counts = staging.stage_tree(src, dst)
+    assert counts == {'copy': 3, 'reflink': 0, 'link': 0}
+    for name in ['data.csv', 'main.cpp', os.path.join('sub', 'more.csv')]:
+        assert contents(os.path.join(dst, name)) == name
+        assert os.stat(os.path.join(dst, name)).st_ino != os.stat(os.path.join(src, name)).st_ino
+
+def test__stage_tree_link(src, dst):
+    counts = staging.stage_tree(src, dst, mode='link', readonly=['*.csv'])
+    assert sum(counts.values()) == 3
+    if counts['reflink'] == 0:
+        assert counts == {'copy': 1, 'reflink': 0, 'link': 2}
+        assert os.path.samefile(os.path.join(src, 'data.csv'), os.path.join(dst, 'data.csv'))
+        assert not os.path.samefile(os.path.join(src, 'main.cpp'), os.path.join(dst, 'main.cpp'))
+
+def test__write_breaks_link(src, dst):
+    staging.stage_tree(src, dst, mode='link', readonly=['*.csv'])
+    data = {}
+    assert WriteFile('data.csv', 'changed').perform(data, dst)
+    assert contents(os.path.join(dst, 'data.csv')) == 'changed'
+    assert contents(os.path.join(src, 'data.csv')) == 'data.csv'
+
+def test__stage_tree_bad_mode(src, dst):
+    with pytest.raises(ValueError):
+        staging.stage_tree(src, dst, mode='symlink')